@@ -1,16 +1,14 @@
 import streamlit as st
 import os
 import sys
+import time
+
+# Shared helpers (e.g. the ONNX emotion backend) live in backend/
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "backend"))
 
 # Show Python version for debugging
 print(f"Python version: {sys.version}", flush=True)
 
-try:
-    from groq import Groq
-    print("Groq imported successfully", flush=True)
-except Exception as e:
-    print(f"Error importing Groq: {e}", flush=True)
-
 try:
     from transformers import pipeline
     print("Transformers imported successfully", flush=True)
@@ -50,8 +48,13 @@ st.set_page_config(
 # LOAD MODELS (cached)
 # ==========================================
 
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "torch").lower()
+
 @st.cache_resource
 def load_emotion_model():
+    if EMOTION_BACKEND == "onnx":
+        from onnx_emotion import load_onnx_classifier
+        return load_onnx_classifier()
     return pipeline(
         "text-classification",
         model="j-hartmann/emotion-english-distilroberta-base"
@@ -76,22 +79,38 @@ def load_knowledge_base():
         "Professional help is important for persistent mental health issues."
     ]
     
-    model = load_rag_model()
-    embeddings = model.encode(knowledge)
+    # Embeddings are cached on disk; only new or changed lines are encoded
+    from embedding_cache import encode_with_cache, cached_index
+    embeddings = encode_with_cache(
+        "all-MiniLM-L6-v2",
+        lambda lines: load_rag_model().encode(lines),
+        knowledge,
+        corpus="streamlit"
+    )
     
-    if len(embeddings.shape) == 1:
-        embeddings = np.expand_dims(embeddings, axis=0)
+    def build():
+        index = faiss.IndexFlatL2(embeddings.shape[1])
+        index.add(np.ascontiguousarray(embeddings))
+        return index
     
-    dimension = embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(np.array(embeddings))
+    index = cached_index("all-MiniLM-L6-v2", knowledge, build, corpus="streamlit")
     
     return knowledge, index
 
+@st.cache_resource
+def load_query_cache():
+    from ttl_cache import TTLCache
+    return TTLCache(
+        int(os.getenv("QUERY_CACHE_SIZE", "2048")),
+        float(os.getenv("QUERY_CACHE_TTL", "3600")),
+        name="rag_query"
+    )
+
 # Load models
 emotion_classifier = load_emotion_model()
 rag_model = load_rag_model()
 knowledge, faiss_index = load_knowledge_base()
+query_cache = load_query_cache()
 
 # ==========================================
 # HELPER FUNCTIONS
@@ -102,51 +121,181 @@ def detect_emotion(text):
     return result["label"]
 
 def crisis_detection(text):
-    keywords = ["suicide", "kill myself", "end my life", "hopeless", "don't want to live", "want to die"]
-    return any(word in text.lower() for word in keywords)
+    # Same compiled lexicon (data/crisis_lexicon.txt) as the backend
+    from crisis_lexicon import is_crisis
+    return is_crisis(text)
 
 def retrieve_context(query):
-    query_vector = rag_model.encode([query])
+    # The knowledge list is fixed, so results are cached by normalized text
+    key = " ".join(query.lower().split())
+    cached = query_cache.get(key)
+    if cached is not None:
+        return cached
+    
+    query_vector = rag_model.encode([key])
     D, I = faiss_index.search(np.array(query_vector), k=min(2, len(knowledge)))
-    return " ".join([knowledge[i] for i in I[0]])
+    context = " ".join([knowledge[i] for i in I[0]])
+    query_cache.put(key, context)
+    return context
 
-def generate_ai_response(user_input, emotion, history):
-    api_key = os.getenv("GROQ_API_KEY")
-    
-    if not api_key:
-        return "I'm here to listen. Please share what's on your mind, and I'll do my best to support you. 💜"
-    
-    context = retrieve_context(user_input)
+def build_prompt(user_input, emotion, history, context=None):
+    # Role-separated chat messages: recent turns verbatim within the token
+    # budget, older ones through st.session_state.summary
+    from prompt_builder import select_turns, build_chat_messages, count_message_tokens
+    apply_summary()
+    if context is None:
+        context = retrieve_context(user_input)
     
-    prompt = f"""You are a compassionate mental health assistant.
+    system = f"""You are a compassionate mental health support assistant. Be empathetic, supportive, and encouraging. Never provide medical diagnoses.
 
 Detected emotion: {emotion}
 
 Relevant knowledge:
 {context}
 
-Conversation history:
-{history}
-
-User message:
-{user_input}
-
 Respond empathetically. Do not give medical diagnosis. Encourage professional help if needed."""
+    
+    recent = select_turns(history)
+    messages = build_chat_messages(system, user_input, recent, st.session_state.summary)
+    print(f"Prompt: {count_message_tokens(messages)} tokens, {len(recent)}/{len(history)} turns verbatim", flush=True)
+    return messages
+
+@st.cache_resource
+def load_summary_executor():
+    # Summaries are folded off the script thread, as the backend Summarizer
+    # does, so a slow summary model never holds up the next message
+    from concurrent.futures import ThreadPoolExecutor
+    return ThreadPoolExecutor(max_workers=2, thread_name_prefix="summarizer")
+
+def apply_summary():
+    # Adopts the session's background summary fold once it has finished
+    job = st.session_state.get("summary_job")
+    if job is None or not job[0].done():
+        return
+    future, summarized = job
+    st.session_state.summary_job = None
+    try:
+        st.session_state.summary = future.result()
+    except Exception as e:
+        print(f"Summary fold failed: {e}", flush=True)
+        return
+    st.session_state.summarized = summarized
+    st.session_state.history = [t for t in st.session_state.history if t.seq >= summarized]
+
+def remember_turn(user_input, response, emotion):
+    # Keeps the session's turns and folds the ones that no longer fit the
+    # prompt budget into the rolling summary
+    from conversation_store import ChatTurn, History
+    from prompt_builder import pending_turns, fold_summary
+    apply_summary()
+    history = st.session_state.history
+    seq = history[-1].seq + 1 if history else st.session_state.summarized
+    history.append(ChatTurn(user_input, response, emotion, seq))
+    
+    if st.session_state.get("summary_job") is not None:
+        return  # still folding; these turns go into the next fold
+    pending = pending_turns(History(tuple(history), st.session_state.summary, st.session_state.summarized))
+    if pending:
+        future = load_summary_executor().submit(fold_summary, st.session_state.summary, pending)
+        st.session_state.summary_job = (future, pending[-1].seq + 1)
+
+FALLBACK_REPLY = "I'm here for you. It sounds like you're going through a difficult time. Please know that your feelings are valid. Consider reaching out to a counselor or trusted friend. You're not alone. 💜"
+
+def stream_ai_response(user_input, emotion, history, context=None):
+    api_key = os.getenv("GROQ_API_KEY")
+    
+    if not api_key:
+        yield "I'm here to listen. Please share what's on your mind, and I'll do my best to support you. 💜"
+        return
+    
+    messages = build_prompt(user_input, emotion, history, context)
+    sent = False
 
     try:
-        client = Groq(api_key=api_key)
-        response = client.chat.completions.create(
+        # Shared pooled client with timeouts, retries and a circuit breaker
+        from llm_client import stream
+        for delta in stream(
+            messages,
             model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": "You are a compassionate mental health support assistant. Be empathetic, supportive, and encouraging. Never provide medical diagnoses."},
-                {"role": "user", "content": prompt}
-            ],
             temperature=0.7,
             max_tokens=500
-        )
-        return response.choices[0].message.content
+        ):
+            sent = True
+            yield delta
     except Exception as e:
-        return f"I'm here for you. It sounds like you're going through a difficult time. Please know that your feelings are valid. Consider reaching out to a counselor or trusted friend. You're not alone. 💜"
+        print(f"Groq API Error: {e}", flush=True)
+    
+    if not sent:
+        yield FALLBACK_REPLY
+
+def assistant_html(content, emotion):
+    emotion_class = f"emotion-{emotion}" if emotion in ['joy', 'sadness', 'anger', 'fear', 'surprise', 'disgust'] else 'emotion-neutral'
+    return f"""
+        <div class="message-container assistant">
+            <div class="message-content">
+                <div class="avatar assistant">🧠</div>
+                <div class="message-text">
+                    {content}
+                    <br><span class="emotion-badge {emotion_class}">Detected: {emotion.capitalize()}</span>
+                </div>
+            </div>
+        </div>
+        """
+
+@st.cache_resource
+def load_pipeline():
+    # Crisis check, then emotion detection and retrieval in parallel; the
+    # reply itself is streamed below rather than run as a pipeline stage.
+    from chat_pipeline import ChatPipeline
+    return ChatPipeline(
+        crisis=crisis_detection,
+        emotion=detect_emotion,
+        retrieve=retrieve_context,
+        crisis_reply="I'm really concerned about what you've shared. Please know that you matter and help is available. Please contact a crisis helpline immediately: Call 988 (Suicide & Crisis Lifeline) or text HOME to 741741. You don't have to face this alone. 💜"
+    )
+
+def respond(user_input):
+    # Renders the reply incrementally as tokens arrive; returns (reply, emotion)
+    pipeline = load_pipeline()
+    turn = pipeline.prepare(user_input)
+    if turn.crisis:
+        pipeline.finish(turn)
+        return turn.reply, turn.emotion
+    
+    emotion = turn.emotion
+    st.markdown(f"""
+        <div class="message-container user">
+            <div class="message-content">
+                <div class="avatar user">👤</div>
+                <div class="message-text">{user_input}</div>
+            </div>
+        </div>
+        """, unsafe_allow_html=True)
+    placeholder = st.empty()
+    
+    llm_started = time.perf_counter()
+    
+    # Opening messages (e.g. the quick-suggestion buttons) may be answered
+    # from the semantic response cache shared with the backend code
+    from response_cache import response_cache
+    first_turn = response_cache.enabled and not st.session_state.history and not st.session_state.summary
+    entry, response = None, None
+    if first_turn:
+        vector = rag_model.encode([" ".join(user_input.lower().split())])
+        entry, response = response_cache.lookup(vector, emotion)
+    
+    if response is None:
+        response = ""
+        for delta in stream_ai_response(user_input, emotion, st.session_state.history, turn.context):
+            response += delta
+            placeholder.markdown(assistant_html(response + " ▌", emotion.lower()), unsafe_allow_html=True)
+        if first_turn and response != FALLBACK_REPLY:
+            response_cache.add(vector, emotion, response, entry)
+    placeholder.markdown(assistant_html(response, emotion.lower()), unsafe_allow_html=True)
+    pipeline.record_llm(turn, time.perf_counter() - llm_started)
+    pipeline.finish(turn)
+    
+    return response, emotion
 
 # ==========================================
 # CSS STYLING
@@ -376,6 +525,10 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "history" not in st.session_state:
     st.session_state.history = []
+if "summary" not in st.session_state:
+    st.session_state.summary = ""
+    st.session_state.summarized = 0
+    st.session_state.summary_job = None
 
 # ==========================================
 # SIDEBAR
@@ -388,6 +541,9 @@ with st.sidebar:
     if st.button("➕ New Chat", use_container_width=True):
         st.session_state.messages = []
         st.session_state.history = []
+        st.session_state.summary = ""
+        st.session_state.summarized = 0
+        st.session_state.summary_job = None
         st.rerun()
     
     st.markdown("<br>", unsafe_allow_html=True)
@@ -514,36 +670,18 @@ if "pending" in st.session_state:
     
     st.session_state.messages.append({"role": "user", "content": pending})
     
-    # Check for crisis
-    if crisis_detection(pending):
-        response = "I'm really concerned about what you've shared. Please know that you matter and help is available. Please contact a crisis helpline immediately: Call 988 (Suicide & Crisis Lifeline) or text HOME to 741741. You don't have to face this alone. 💜"
-        emotion = "critical"
-    else:
-        emotion = detect_emotion(pending)
-        history_text = "\n".join(st.session_state.history[-6:])
-        response = generate_ai_response(pending, emotion, history_text)
+    response, emotion = respond(pending)
     
     st.session_state.messages.append({"role": "assistant", "content": response, "emotion": emotion})
-    st.session_state.history.append(f"User: {pending}")
-    st.session_state.history.append(f"Assistant: {response}")
+    remember_turn(pending, response, emotion)
     st.rerun()
 
 # Chat input
 if prompt := st.chat_input("Message MindCare AI..."):
     st.session_state.messages.append({"role": "user", "content": prompt})
     
-    # Check for crisis
-    if crisis_detection(prompt):
-        response = "I'm really concerned about what you've shared. Please know that you matter and help is available. Please contact a crisis helpline immediately: Call 988 (Suicide & Crisis Lifeline) or text HOME to 741741. You don't have to face this alone. 💜"
-        emotion = "critical"
-    else:
-        emotion = detect_emotion(prompt)
-        history_text = "\n".join(st.session_state.history[-6:])
-        
-        with st.spinner(""):
-            response = generate_ai_response(prompt, emotion, history_text)
+    response, emotion = respond(prompt)
     
     st.session_state.messages.append({"role": "assistant", "content": response, "emotion": emotion})
-    st.session_state.history.append(f"User: {prompt}")
-    st.session_state.history.append(f"Assistant: {response}")
+    remember_turn(prompt, response, emotion)
     st.rerun()
@@ -0,0 +1,178 @@
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+
+# Token buckets for /chat: each user may send CHAT_USER_BURST messages at
+# once, refilled at CHAT_USER_RATE per second; the whole process accepts
+# CHAT_GLOBAL_RATE per second with a burst of CHAT_GLOBAL_BURST.
+CHAT_ADMISSION = os.getenv("CHAT_ADMISSION", "1") == "1"
+CHAT_USER_RATE = float(os.getenv("CHAT_USER_RATE", "0.5"))
+CHAT_USER_BURST = float(os.getenv("CHAT_USER_BURST", "5"))
+CHAT_GLOBAL_RATE = float(os.getenv("CHAT_GLOBAL_RATE", "20"))
+CHAT_GLOBAL_BURST = float(os.getenv("CHAT_GLOBAL_BURST", "40"))
+
+# Chats being processed at once (crisis check through persistence); beyond
+# this new ones are shed rather than queued behind the model and the LLM
+CHAT_MAX_IN_FLIGHT = int(os.getenv("CHAT_MAX_IN_FLIGHT", "32"))
+
+# Per-user buckets kept; the least recently seen are dropped first
+ADMISSION_MAX_USERS = int(os.getenv("ADMISSION_MAX_USERS", "10000"))
+
+
+class Rejected(Exception):
+
+    def __init__(self, reason, retry_after):
+        super().__init__(f"{reason} limit reached, retry after {retry_after}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    # Not thread-safe; AdmissionController holds its lock around every call
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = now
+
+    def take(self, now):
+        # Returns 0 if a token was taken, otherwise seconds until one is free
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return 0.0
+        if self.rate <= 0:
+            return math.inf
+        return (1.0 - self.tokens) / self.rate
+
+    def refund(self):
+        self.tokens = min(self.burst, self.tokens + 1.0)
+
+
+class Ticket:
+    """An admitted chat; ``release()`` (or leaving the ``with`` block) frees
+    its in-flight slot. Releasing twice is a no-op."""
+
+    __slots__ = ("_controller", "_released")
+
+    def __init__(self, controller):
+        self._controller = controller
+        self._released = False
+
+    def release(self):
+        if not self._released:
+            self._released = True
+            self._controller._release()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Per-user and global token buckets plus a cap on in-flight requests.
+
+    ``admit(user_id)`` never blocks: it returns a Ticket or raises Rejected
+    with the reason ("user", "global" or "in_flight") and a Retry-After in
+    whole seconds. ``admit(user_id, bypass=True)`` always succeeds and is
+    used for crisis messages, which must never be shed.
+    """
+
+    def __init__(self, user_rate=CHAT_USER_RATE, user_burst=CHAT_USER_BURST,
+                 global_rate=CHAT_GLOBAL_RATE, global_burst=CHAT_GLOBAL_BURST,
+                 max_in_flight=CHAT_MAX_IN_FLIGHT, max_users=ADMISSION_MAX_USERS,
+                 enabled=CHAT_ADMISSION):
+        self.enabled = enabled
+        self.user_rate = user_rate
+        self.user_burst = user_burst
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.max_users = max(1, int(max_users))
+
+        self._lock = threading.Lock()
+        self._users = OrderedDict()
+        self._global = TokenBucket(global_rate, global_burst, time.monotonic())
+        self.in_flight = 0
+
+        self.admitted = 0
+        self.bypassed = 0
+        self.rejected = {"user": 0, "global": 0, "in_flight": 0}
+        self.peak_in_flight = 0
+
+    def admit(self, user_id, bypass=False):
+        with self._lock:
+            if bypass or not self.enabled:
+                if bypass:
+                    self.bypassed += 1
+                return self._enter()
+
+            now = time.monotonic()
+
+            bucket = self._users.get(user_id)
+            if bucket is None:
+                bucket = TokenBucket(self.user_rate, self.user_burst, now)
+                self._users[user_id] = bucket
+                if len(self._users) > self.max_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+
+            wait = bucket.take(now)
+            if wait:
+                raise self._reject("user", wait)
+
+            wait = self._global.take(now)
+            if wait:
+                bucket.refund()
+                raise self._reject("global", wait)
+
+            if self.in_flight >= self.max_in_flight:
+                bucket.refund()
+                self._global.refund()
+                raise self._reject("in_flight", 1.0)
+
+            self.admitted += 1
+            return self._enter()
+
+    def _enter(self):
+        self.in_flight += 1
+        if self.in_flight > self.peak_in_flight:
+            self.peak_in_flight = self.in_flight
+        return Ticket(self)
+
+    def _release(self):
+        with self._lock:
+            self.in_flight -= 1
+
+    def _reject(self, reason, wait):
+        self.rejected[reason] += 1
+        retry_after = 3600 if math.isinf(wait) else max(1, math.ceil(wait))
+        return Rejected(reason, retry_after)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "admitted": self.admitted,
+                "crisis_bypassed": self.bypassed,
+                "rejected": dict(self.rejected),
+                "in_flight": self.in_flight,
+                "peak_in_flight": self.peak_in_flight,
+                "max_in_flight": self.max_in_flight,
+                "tracked_users": len(self._users),
+                "user_rate": self.user_rate,
+                "user_burst": self.user_burst,
+                "global_rate": self._global.rate,
+                "global_burst": self._global.burst
+            }
+
+
+chat_admission = AdmissionController()
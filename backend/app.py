@@ -1,43 +1,64 @@
-from flask import Flask, request, jsonify
+import atexit
+import json
+import os
+import queue
+import time
+from datetime import datetime
+from functools import partial
+from flask import Flask, Blueprint, Response, current_app, g, request, jsonify, stream_with_context
 from flask_login import login_required, current_user
 from flask_cors import CORS
-from db import init_db, db
+from db import init_db, db, upgrade_schema
 from models import Conversation
-from auth import init_auth, register_user, login_user_route, logout_user_route
-from emotion_model import detect_emotion
-from gemini_service import generate_ai_response
-from crisis_detection import crisis_detection
-
-app = Flask(__name__)
-app.secret_key = "supersecretkey"
-app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
-app.config['SESSION_COOKIE_SECURE'] = False
-CORS(app, supports_credentials=True)
-
-# Initialize DB & Auth
-init_db(app)
-init_auth(app)
-
-with app.app_context():
-    db.create_all()
-
-conversation_history = {}
+from auth import init_auth, register_user, login_user_route, logout_user_route, auth_stats
+from emotion_model import detect_emotion, batching_stats
+from gemini_service import generate_ai_response, stream_ai_response, latency_stats, FALLBACK_REPLY
+from crisis_detection import crisis_detection, detect_crisis, CRISIS_REPLY
+from message_features import MessageFeatures
+from rag_engine import retrieve_context, reload_knowledge, start_watcher, cache_stats
+from chat_pipeline import ChatPipeline
+from response_cache import response_cache
+from conversation_store import conversations
+from prompt_builder import summarizer
+import lazy
+import fast_json
+import history_pages
+import metrics
+import request_trace
+from write_behind import WriteBehindQueue
+from admission import chat_admission, Rejected
+
+# Load the models in a background thread right after startup instead of on
+# the first /chat request.
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "0") == "1"
+
+# "write_behind" acknowledges a turn once it is queued and commits in
+# batches on a background thread; "sync" commits before replying.
+PERSIST_MODE = os.getenv("PERSIST_MODE", "sync")
+WRITE_BEHIND_BATCH_SIZE = int(os.getenv("WRITE_BEHIND_BATCH_SIZE", "64"))
+WRITE_BEHIND_MAX_DELAY_MS = float(os.getenv("WRITE_BEHIND_MAX_DELAY_MS", "50"))
+WRITE_BEHIND_MAX_QUEUE = int(os.getenv("WRITE_BEHIND_MAX_QUEUE", "10000"))
+
+# Admin routes are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+api = Blueprint("api", __name__)
 
 # =====================
 # AUTH ROUTES
 # =====================
 
-@app.route("/register", methods=["POST"])
+@api.route("/register", methods=["POST"])
 def register():
     return register_user()
 
 
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 def login():
     return login_user_route()
 
 
-@app.route("/logout", methods=["POST"])
+@api.route("/logout", methods=["POST"])
 @login_required
 def logout():
     return logout_user_route()
@@ -47,7 +68,100 @@ def logout():
 # CHAT ROUTE (PROTECTED)
 # =====================
 
-@app.route("/chat", methods=["POST"])
+def _persist_turn(turn, app, user_id):
+    # Runs on the persistence stage's thread, outside the request context
+    row = {
+        "user_id": user_id,
+        "message": turn.message.text,
+        "response": turn.reply,
+        "emotion": turn.emotion,
+        "created_at": datetime.utcnow()
+    }
+
+    write_behind = app.extensions.get("write_behind")
+    if write_behind is not None:
+        try:
+            write_behind.submit(row)
+            return
+        except queue.Full:
+            pass  # backlog over its limit: write this one synchronously
+
+    with app.app_context(), metrics.db_commit_seconds.labels("sync").time():
+        db.session.add(Conversation(**row))
+        db.session.commit()
+
+
+def _write_rows(app, rows):
+    # One INSERT ... executemany and one commit per write-behind batch
+    with app.app_context():
+        try:
+            with metrics.db_commit_seconds.labels("batch").time():
+                db.session.execute(db.insert(Conversation), rows)
+                db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+
+def _cached_reply(features, emotion, history):
+    # Opening messages (empty history) may be answered from the semantic
+    # response cache. Returns (entry, reply); reply is None on a miss.
+    if not response_cache.enabled or history:
+        return None, None
+    return response_cache.lookup(features.embedding, emotion)
+
+
+def _cache_reply(features, emotion, history, reply, entry):
+    if response_cache.enabled and not history and reply != FALLBACK_REPLY:
+        response_cache.add(features.embedding, emotion, reply, entry)
+
+
+def _generate_reply(features, emotion, history, context):
+    entry, reply = _cached_reply(features, emotion, history)
+    if reply is not None:
+        return reply
+
+    reply = generate_ai_response(features.text, emotion, history, features, context)
+    _cache_reply(features, emotion, history, reply, entry)
+    return reply
+
+
+def _admit_chat(user_id, features):
+    # Raises Rejected when the user, global or in-flight limit is hit.
+    # Crisis messages are never shed: a rejected request still gets the
+    # crisis check and is admitted past the limits if it is flagged.
+    try:
+        return chat_admission.admit(user_id)
+    except Rejected:
+        try:
+            flagged = detect_crisis(features)
+        except Exception:
+            flagged = crisis_detection(features.text)
+        if flagged:
+            return chat_admission.admit(user_id, bypass=True)
+        raise
+
+
+def _too_many_requests(rejection):
+    return jsonify({
+        "error": "Too many messages, please wait a moment",
+        "reason": rejection.reason
+    }), 429, {"Retry-After": str(rejection.retry_after)}
+
+
+chat_pipeline = ChatPipeline(
+    crisis=detect_crisis,
+    emotion=lambda features: detect_emotion(features.text),
+    retrieve=lambda features: retrieve_context(features.text, features),
+    generate=_generate_reply,
+    persist=_persist_turn,
+    crisis_reply=CRISIS_REPLY,
+    crisis_fallback=lambda features: crisis_detection(features.text),
+    fallback_reply=FALLBACK_REPLY
+)
+
+
+@api.route("/chat", methods=["POST"])
 def chat():
 
     user_input = request.json["message"]
@@ -56,70 +170,344 @@ def chat():
     if not user_id:
         return jsonify({"error": "User ID required"}), 401
 
-    # Crisis detection
-    if crisis_detection(user_input):
+    # Shared by crisis detection and retrieval (one embedding pass)
+    features = MessageFeatures(user_input)
+
+    try:
+        ticket = _admit_chat(user_id, features)
+    except Rejected as e:
+        return _too_many_requests(e)
+
+    with ticket:
+        return _chat(features, user_id)
+
+
+def _chat(features, user_id):
+    user_input = features.text
+
+    # Crisis check, then emotion detection and retrieval in parallel
+    turn = chat_pipeline.prepare(features)
+
+    if turn.crisis:
+        chat_pipeline.finish(turn)
         return jsonify({
             "emotion": "critical",
-            "reply": "I'm really concerned. Please contact a trusted person or local helpline immediately."
+            "reply": CRISIS_REPLY
         })
 
-    # Detect emotion
-    emotion = detect_emotion(user_input)
-
-    if user_id not in conversation_history:
-        conversation_history[user_id] = []
-
-    user_history = conversation_history[user_id]
+    user_history = conversations.history(user_id)
 
     # Generate response
-    response = generate_ai_response(user_input, emotion, user_history)
+    response = chat_pipeline.generate(turn, user_history)
 
     # Update memory
-    user_history.append(f"User: {user_input}")
-    user_history.append(f"Bot: {response}")
+    conversations.append(user_id, user_input, response, turn.emotion)
+    summarizer.schedule(user_id)
 
     # Save to database
-    convo = Conversation(
-        user_id=user_id,
-        message=user_input,
-        response=response,
-        emotion=emotion
-    )
-
-    db.session.add(convo)
-    db.session.commit()
+    chat_pipeline.persist(turn, current_app._get_current_object(), user_id)
+    chat_pipeline.finish(turn)
 
     return jsonify({
-        "emotion": emotion,
+        "emotion": turn.emotion,
         "reply": response
     })
 
 
+# =====================
+# STREAMING CHAT ROUTE
+# =====================
+
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@api.route("/chat/stream", methods=["POST"])
+def chat_stream():
+    started = time.perf_counter()
+
+    user_input = request.json["message"]
+    user_id = request.json.get("user_id")
+
+    if not user_id:
+        return jsonify({"error": "User ID required"}), 401
+
+    features = MessageFeatures(user_input)
+    app = current_app._get_current_object()
+
+    try:
+        ticket = _admit_chat(user_id, features)
+    except Rejected as e:
+        return _too_many_requests(e)
+
+    def generate():
+        turn = chat_pipeline.prepare(features)
+
+        if turn.crisis:
+            chat_pipeline.finish(turn)
+            yield _sse({
+                "type": "done",
+                "emotion": "critical",
+                "reply": CRISIS_REPLY
+            })
+            return
+
+        yield _sse({"type": "meta", "emotion": turn.emotion})
+
+        user_history = conversations.history(user_id)
+
+        llm_started = time.perf_counter()
+        entry, cached = _cached_reply(features, turn.emotion, user_history)
+
+        if cached is not None:
+            turn.reply = cached
+            yield _sse({"type": "delta", "content": cached})
+        else:
+            parts = []
+            for delta in stream_ai_response(
+                user_input, turn.emotion, user_history, features, started, turn.context
+            ):
+                parts.append(delta)
+                yield _sse({"type": "delta", "content": delta})
+
+            turn.reply = "".join(parts)
+            _cache_reply(features, turn.emotion, user_history, turn.reply, entry)
+
+        chat_pipeline.record_llm(turn, time.perf_counter() - llm_started)
+
+        conversations.append(user_id, user_input, turn.reply, turn.emotion)
+        summarizer.schedule(user_id)
+
+        chat_pipeline.persist(turn, app, user_id)
+        chat_pipeline.finish(turn)
+
+        yield _sse({"type": "done", "emotion": turn.emotion, "reply": turn.reply, "timings": turn.timings})
+
+    response = Response(
+        stream_with_context(generate()),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # Holds the in-flight slot until the stream ends or the client leaves
+    response.call_on_close(ticket.release)
+    return response
+
+
 # =====================
 # GET CHAT HISTORY
 # =====================
 
-@app.route("/history", methods=["POST"])
+@api.route("/history", methods=["GET", "POST"])
 def get_history():
-    user_id = request.json.get("user_id")
+    # GET (query string) returns {"items", "has_more", "next_before_id"}
+    # and supports conditional requests: send the last ETag in If-None-Match
+    # and an unchanged history costs one index lookup and a 304. POST (JSON
+    # body) is kept for older clients and still returns a plain list.
+    conditional = request.method == "GET"
+    data = request.args if conditional else request.json
+    user_id = data.get("user_id", type=int) if conditional else data.get("user_id")
 
     if not user_id:
         return jsonify({"error": "User ID required"}), 401
 
-    conversations = Conversation.query.filter_by(
-        user_id=user_id
-    ).all()
+    try:
+        before_id, since_id, limit = history_pages.page_args(data)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid before_id, since_id or limit"}), 400
+
+    latest_id = db.session.execute(history_pages.latest_id_statement(user_id)).scalar()
+    tag = history_pages.etag(user_id, latest_id, before_id, since_id, limit)
+
+    if conditional and request.if_none_match.contains(tag):
+        response = Response(status=304)
+    else:
+        rows = db.session.execute(
+            history_pages.page_statement(user_id, before_id, limit, since_id)
+        ).all()
+        payload = history_pages.page_payload if conditional else history_pages.legacy_payload
+        response = Response(fast_json.dumps(payload(rows, limit)), mimetype="application/json")
+
+    if conditional:
+        response.set_etag(tag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+
+# =====================
+# STATS
+# =====================
+
+@api.route("/stats/emotion", methods=["GET"])
+def emotion_stats():
+    return jsonify(batching_stats())
+
+
+@api.route("/stats/cache", methods=["GET"])
+def query_cache_stats():
+    return jsonify({"rag_query": cache_stats(), "response": response_cache.stats()})
+
+
+@api.route("/stats/llm", methods=["GET"])
+def llm_stats():
+    return jsonify(latency_stats())
+
+
+@api.route("/stats/pipeline", methods=["GET"])
+def pipeline_stats():
+    return jsonify(chat_pipeline.stats())
+
+
+@api.route("/stats/conversations", methods=["GET"])
+def conversation_stats():
+    return jsonify(dict(conversations.stats(), summary_folds=summarizer.folds))
+
+
+@api.route("/stats/persistence", methods=["GET"])
+def persistence_stats():
+    write_behind = current_app.extensions.get("write_behind")
+    if write_behind is None:
+        return jsonify({"mode": "sync", "durability": "committed before reply"})
+    return jsonify(write_behind.stats())
+
+
+@api.route("/stats/admission", methods=["GET"])
+def admission_stats():
+    return jsonify(chat_admission.stats())
+
+
+@api.route("/stats/auth", methods=["GET"])
+def password_stats():
+    return jsonify(auth_stats())
+
+
+@api.route("/metrics", methods=["GET"])
+def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@api.route("/stats/startup", methods=["GET"])
+def startup_stats():
+    return jsonify(lazy.status())
+
+
+# =====================
+# ADMIN
+# =====================
+
+@api.route("/admin/reload-knowledge", methods=["POST"])
+def admin_reload_knowledge():
+    if not ADMIN_TOKEN or request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return jsonify({"error": "Forbidden"}), 403
+
+    return jsonify(reload_knowledge())
+
+
+# =====================
+# APP FACTORY
+# =====================
+
+def _start_request():
+    g.trace = request_trace.begin(
+        request.endpoint or "unmatched",
+        request.headers.get("X-Request-ID"),
+        profile=request_trace.wants_profile(request.headers.get("X-Profile"))
+    )
 
-    history = [
-        {
-            "message": c.message,
-            "response": c.response,
-            "emotion": c.emotion
-        }
-        for c in conversations
-    ]
 
-    return jsonify(history)
+def _finish_request(response):
+    trace = g.get("trace")
+    if trace is not None:
+        metrics.record_request(
+            request.method, request.endpoint, response.status_code, time.perf_counter() - trace.started
+        )
+        # Streams only know the time to their headers here; their stage
+        # timings are sent in the final "done" event
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Request-ID"] = trace.request_id
+
+        if response.is_streamed:
+            # Teardown runs before the body is sent; end the trace (and its
+            # profile) once the last event is out instead
+            g.trace_streaming = True
+            response.call_on_close(partial(request_trace.end, trace))
+    return response
+
+
+def _end_request(error=None):
+    trace = g.get("trace")
+    if trace is not None and not g.get("trace_streaming"):
+        g.trace = None
+        request_trace.end(trace)
+
+
+def _app_samples(app):
+    auth = auth_stats()
+    users = auth["user_cache"]
+    yield ("mindcare_cache_hits_total", "counter", "Cache hits", {"cache": "users"}, users["hits"])
+    yield ("mindcare_cache_lookups_total", "counter", "Cache lookups", {"cache": "users"},
+           users["hits"] + users["misses"])
+    yield ("mindcare_cache_hit_ratio", "gauge", "Cache hits / lookups", {"cache": "users"}, users["hit_rate"])
+    yield ("mindcare_cache_entries", "gauge", "Cache entries", {"cache": "users"}, users["size"])
+    yield ("mindcare_password_hash_rejected_total", "counter", "Password hashes refused with 503",
+           None, auth["password_hashing"]["rejected"])
+
+    write_behind = app.extensions.get("write_behind")
+    if write_behind is not None:
+        queued = write_behind.stats()
+        yield ("mindcare_write_behind_queue_depth", "gauge", "Conversation rows waiting to be written",
+               None, queued["queue_depth"])
+        yield ("mindcare_write_behind_failed_total", "counter", "Conversation rows that failed to write",
+               None, queued["failed"])
+
+
+def create_app(warm_up=WARMUP_MODELS):
+    started = time.perf_counter()
+
+    app = Flask(__name__)
+    app.secret_key = "supersecretkey"
+    app.config['SESSION_COOKIE_SAMESITE'] = 'Lax'
+    app.config['SESSION_COOKIE_SECURE'] = False
+    CORS(app, supports_credentials=True, expose_headers=["Server-Timing", "X-Request-ID"])
+
+    # Initialize DB & Auth
+    init_db(app)
+    init_auth(app)
+
+    with app.app_context():
+        db.create_all()
+        with db.engine.begin() as connection:
+            upgrade_schema(connection)
+
+    app.register_blueprint(api)
+
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    app.teardown_request(_end_request)
+    metrics.register_collector(partial(_app_samples, app))
+
+    if PERSIST_MODE == "write_behind":
+        write_behind = WriteBehindQueue(
+            partial(_write_rows, app),
+            max_batch_size=WRITE_BEHIND_BATCH_SIZE,
+            max_delay_ms=WRITE_BEHIND_MAX_DELAY_MS,
+            max_queue=WRITE_BEHIND_MAX_QUEUE,
+            name="conversation_writer"
+        )
+        app.extensions["write_behind"] = write_behind
+        # Drain the queue when the worker exits normally (gunicorn SIGTERM)
+        atexit.register(write_behind.stop)
+
+    lazy.record_time("app", started)
+
+    if warm_up:
+        lazy.warm_up(background=True)
+
+    start_watcher()
+
+    return app
+
+
+app = create_app()
 
 
 if __name__ == "__main__":
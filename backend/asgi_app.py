@@ -0,0 +1,515 @@
+# Async serving mode. Run with:
+#   cd backend && uvicorn asgi_app:app --host 0.0.0.0 --port $PORT
+#
+# Routes mirror app.py, but run on an event loop: the Groq call is awaited
+# with AsyncGroq, model inference runs in a bounded thread pool and the
+# database is accessed through an async SQLAlchemy session, so one process
+# can hold many conversations that are waiting on the LLM.
+
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from quart import Quart, Response, g, request, jsonify
+from quart_cors import cors
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+from db import db, async_database_uri, engine_options, configure_engine, upgrade_schema
+from models import User, Conversation
+from password_hashing import hasher, HasherBusy
+from emotion_model import detect_emotion, batching_stats
+from gemini_service import build_messages, agenerate_ai_response, astream_ai_response, latency_stats, FALLBACK_REPLY
+from crisis_detection import detect_crisis, crisis_detection, CRISIS_REPLY
+from message_features import MessageFeatures
+from rag_engine import retrieve_context, reload_knowledge, start_watcher, cache_stats
+from response_cache import response_cache
+from conversation_store import conversations
+from prompt_builder import summarizer
+import lazy
+import fast_json
+import history_pages
+import metrics
+import request_trace
+from admission import chat_admission, Rejected
+
+# Threads for CPU-bound work (emotion model, embeddings, bcrypt). Callers
+# beyond INFERENCE_QUEUE_LIMIT wait on the event loop instead of piling up
+# in the executor queue.
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "8"))
+INFERENCE_QUEUE_LIMIT = int(os.getenv("INFERENCE_QUEUE_LIMIT", str(INFERENCE_WORKERS * 4)))
+
+WARMUP_MODELS = os.getenv("WARMUP_MODELS", "0") == "1"
+
+# Admin routes are disabled unless a token is configured
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN")
+
+app = Quart(__name__)
+app = cors(app, allow_origin="*")
+
+executor = ThreadPoolExecutor(max_workers=INFERENCE_WORKERS, thread_name_prefix="inference")
+_inference_slots = None
+
+engine = None
+Session = None
+
+
+async def run_cpu(func, *args):
+    async with _inference_slots:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor, request_trace.bind(func), *args)
+
+
+async def run_stage(name, func, *args, fallback=None):
+    # run_cpu timed as a chat stage (queueing for a thread included). As in
+    # ChatPipeline, an error returns fallback(*args) instead of failing
+    # the chat.
+    started = time.perf_counter()
+    try:
+        return await run_cpu(func, *args)
+    except Exception as e:
+        if fallback is None:
+            raise
+        print(f"Pipeline stage {name}: {e}; using fallback", flush=True)
+        return fallback(*args)
+    finally:
+        record_stage(name, time.perf_counter() - started)
+
+
+def _crisis_fallback(features):
+    return crisis_detection(features.text)
+
+
+def _emotion_fallback(*args):
+    return "neutral"
+
+
+def _retrieval_fallback(*args):
+    return []
+
+
+def record_stage(name, seconds):
+    metrics.stage_seconds.labels(name).observe(seconds)
+    request_trace.record_timing(name, seconds)
+
+
+@app.before_request
+async def start_request():
+    # The event loop thread is shared by every request, so only work sent
+    # to the inference threads is profiled
+    g.trace = request_trace.begin(
+        request.endpoint or "unmatched",
+        request.headers.get("X-Request-ID"),
+        profile=request_trace.wants_profile(request.headers.get("X-Profile")),
+        profile_caller=False
+    )
+
+
+@app.after_request
+async def finish_request(response):
+    trace = getattr(g, "trace", None)
+    if trace is not None:
+        metrics.record_request(
+            request.method, request.endpoint, response.status_code, time.perf_counter() - trace.started
+        )
+        response.headers["Server-Timing"] = trace.server_timing()
+        response.headers["X-Request-ID"] = trace.request_id
+    return response
+
+
+@app.teardown_request
+async def end_request(error=None):
+    trace = getattr(g, "trace", None)
+    if trace is not None and not getattr(g, "trace_streaming", False):
+        g.trace = None
+        request_trace.end(trace)
+
+
+@app.before_serving
+async def startup():
+    global engine, Session, _inference_slots
+    started = time.perf_counter()
+
+    _inference_slots = asyncio.Semaphore(INFERENCE_QUEUE_LIMIT)
+
+    os.makedirs(app.instance_path, exist_ok=True)
+    uri = async_database_uri(app.instance_path)
+    engine = create_async_engine(uri, **engine_options(uri))
+    configure_engine(engine.sync_engine)
+    Session = async_sessionmaker(engine, expire_on_commit=False)
+
+    async with engine.begin() as conn:
+        await conn.run_sync(db.metadata.create_all)
+        await conn.run_sync(upgrade_schema)
+
+    lazy.record_time("asgi_app", started)
+
+    if WARMUP_MODELS:
+        lazy.warm_up(background=True)
+
+    start_watcher()
+
+
+@app.after_serving
+async def shutdown():
+    await engine.dispose()
+    executor.shutdown(wait=False)
+    hasher.shutdown()
+
+
+# =====================
+# AUTH ROUTES
+# =====================
+# Session cookies (flask_login) are not available here; clients identify
+# themselves with the user_id returned by /login, as the Streamlit app does.
+
+@app.route("/register", methods=["POST"])
+async def register():
+    data = await request.get_json()
+
+    if not data.get("username") or not data.get("password"):
+        return jsonify({"error": "Username and password required"}), 400
+
+    async with Session() as session:
+        existing_user = (await session.execute(
+            select(User).filter_by(username=data["username"])
+        )).scalars().first()
+
+        if existing_user:
+            return jsonify({"error": "Username already exists"}), 400
+
+        try:
+            hashed_password = await run_cpu(hasher.hash, data["password"])
+        except HasherBusy:
+            return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
+
+        session.add(User(username=data["username"], password=hashed_password))
+        await session.commit()
+
+    return jsonify({"message": "User registered successfully"}), 201
+
+
+@app.route("/login", methods=["POST"])
+async def login():
+    data = await request.get_json()
+
+    async with Session() as session:
+        user = (await session.execute(
+            select(User).filter_by(username=data["username"])
+        )).scalars().first()
+
+    if not user:
+        return jsonify({"error": "User not found"}), 404
+
+    try:
+        valid = await run_cpu(hasher.check, user.password, data["password"])
+    except HasherBusy:
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
+
+    if valid:
+        return jsonify({"message": "Login successful", "user_id": user.id}), 200
+
+    return jsonify({"error": "Invalid credentials"}), 401
+
+
+@app.route("/logout", methods=["POST"])
+async def logout():
+    return jsonify({"message": "Logged out successfully"}), 200
+
+
+# =====================
+# CHAT ROUTES
+# =====================
+
+async def _save_conversation(user_id, user_input, response, emotion):
+    # A failed write is logged; the user still gets the reply
+    started = time.perf_counter()
+    try:
+        async with Session() as session:
+            session.add(Conversation(
+                user_id=user_id,
+                message=user_input,
+                response=response,
+                emotion=emotion
+            ))
+            with metrics.db_commit_seconds.labels("async").time():
+                await session.commit()
+    except Exception as e:
+        print(f"Conversation turn not saved: {e}", flush=True)
+    finally:
+        record_stage("persist", time.perf_counter() - started)
+
+
+async def _cached_reply(features, emotion, history):
+    # First turns only; see response_cache.py
+    if not response_cache.enabled or history:
+        return None, None
+    # features.embedding may still have to run MiniLM (CRISIS_SEMANTIC=0),
+    # so it is read on an inference thread, never on the event loop
+    return await run_cpu(_lookup_reply, features, emotion)
+
+
+def _lookup_reply(features, emotion):
+    return response_cache.lookup(features.embedding, emotion)
+
+
+async def _cache_reply(features, emotion, history, reply, entry):
+    if response_cache.enabled and not history and reply != FALLBACK_REPLY:
+        await run_cpu(_add_reply, features, emotion, reply, entry)
+
+
+def _add_reply(features, emotion, reply, entry):
+    response_cache.add(features.embedding, emotion, reply, entry)
+
+
+async def _admit_chat(user_id, features):
+    # See app.py: crisis messages are admitted past every limit
+    try:
+        return chat_admission.admit(user_id)
+    except Rejected:
+        try:
+            flagged = await run_cpu(detect_crisis, features)
+        except Exception:
+            flagged = crisis_detection(features.text)
+        if flagged:
+            return chat_admission.admit(user_id, bypass=True)
+        raise
+
+
+def _too_many_requests(rejection):
+    return jsonify({
+        "error": "Too many messages, please wait a moment",
+        "reason": rejection.reason
+    }), 429, {"Retry-After": str(rejection.retry_after)}
+
+
+@app.route("/chat", methods=["POST"])
+async def chat():
+    data = await request.get_json()
+    user_input = data["message"]
+    user_id = data.get("user_id")
+
+    if not user_id:
+        return jsonify({"error": "User ID required"}), 401
+
+    features = MessageFeatures(user_input)
+
+    try:
+        ticket = await _admit_chat(user_id, features)
+    except Rejected as e:
+        return _too_many_requests(e)
+
+    with ticket:
+        return await _chat(features, user_id)
+
+
+async def _chat(features, user_id):
+    user_input = features.text
+
+    if await run_stage("crisis", detect_crisis, features, fallback=_crisis_fallback):
+        return jsonify({"emotion": "critical", "reply": CRISIS_REPLY})
+
+    # Emotion detection and retrieval are independent; run them side by side
+    emotion, context = await asyncio.gather(
+        run_stage("emotion", detect_emotion, user_input, fallback=_emotion_fallback),
+        run_stage("retrieval", retrieve_context, user_input, features, fallback=_retrieval_fallback)
+    )
+
+    user_history = conversations.history(user_id)
+
+    entry, response = await _cached_reply(features, emotion, user_history)
+
+    if response is None:
+        messages = build_messages(user_input, emotion, user_history, features, context)
+        llm_started = time.perf_counter()
+        response = await agenerate_ai_response(messages)
+        record_stage("llm", time.perf_counter() - llm_started)
+        await _cache_reply(features, emotion, user_history, response, entry)
+
+    conversations.append(user_id, user_input, response, emotion)
+    summarizer.schedule(user_id)
+
+    await _save_conversation(user_id, user_input, response, emotion)
+
+    return jsonify({"emotion": emotion, "reply": response})
+
+
+def _sse(payload):
+    return f"data: {json.dumps(payload)}\n\n"
+
+
+@app.route("/chat/stream", methods=["POST"])
+async def chat_stream():
+    started = time.perf_counter()
+
+    data = await request.get_json()
+    user_input = data["message"]
+    user_id = data.get("user_id")
+
+    if not user_id:
+        return jsonify({"error": "User ID required"}), 401
+
+    features = MessageFeatures(user_input)
+
+    try:
+        ticket = await _admit_chat(user_id, features)
+    except Rejected as e:
+        return _too_many_requests(e)
+
+    # The body is sent after the request context is gone; the stream ends
+    # its own trace so stage timings and profiles cover all of it
+    trace = g.trace
+    g.trace_streaming = True
+
+    async def generate():
+        request_trace.resume(trace)
+        try:
+            with ticket:
+                async for event in _chat_events(features, user_id, started, trace):
+                    yield event
+        finally:
+            request_trace.end(trace)
+
+    return generate(), 200, {
+        "Content-Type": "text/event-stream",
+        "Cache-Control": "no-cache",
+        "X-Accel-Buffering": "no"
+    }
+
+
+async def _chat_events(features, user_id, started, trace):
+    user_input = features.text
+
+    if await run_stage("crisis", detect_crisis, features, fallback=_crisis_fallback):
+        yield _sse({"type": "done", "emotion": "critical", "reply": CRISIS_REPLY})
+        return
+
+    emotion, context = await asyncio.gather(
+        run_stage("emotion", detect_emotion, user_input, fallback=_emotion_fallback),
+        run_stage("retrieval", retrieve_context, user_input, features, fallback=_retrieval_fallback)
+    )
+    yield _sse({"type": "meta", "emotion": emotion})
+
+    user_history = conversations.history(user_id)
+    entry, response = await _cached_reply(features, emotion, user_history)
+
+    if response is not None:
+        yield _sse({"type": "delta", "content": response})
+    else:
+        messages = build_messages(user_input, emotion, user_history, features, context)
+
+        llm_started = time.perf_counter()
+        parts = []
+        async for delta in astream_ai_response(messages, started):
+            parts.append(delta)
+            yield _sse({"type": "delta", "content": delta})
+        record_stage("llm", time.perf_counter() - llm_started)
+
+        response = "".join(parts)
+        await _cache_reply(features, emotion, user_history, response, entry)
+
+    conversations.append(user_id, user_input, response, emotion)
+    summarizer.schedule(user_id)
+
+    await _save_conversation(user_id, user_input, response, emotion)
+
+    yield _sse({"type": "done", "emotion": emotion, "reply": response, "timings": trace.timings})
+
+
+# =====================
+# GET CHAT HISTORY
+# =====================
+
+@app.route("/history", methods=["GET", "POST"])
+async def get_history():
+    # See app.py: GET returns a page with If-None-Match support, POST (kept
+    # for older clients) a plain list
+    conditional = request.method == "GET"
+    data = request.args if conditional else await request.get_json()
+    user_id = data.get("user_id", type=int) if conditional else data.get("user_id")
+
+    if not user_id:
+        return jsonify({"error": "User ID required"}), 401
+
+    try:
+        before_id, since_id, limit = history_pages.page_args(data)
+    except (TypeError, ValueError):
+        return jsonify({"error": "Invalid before_id, since_id or limit"}), 400
+
+    async with Session() as session:
+        latest_id = (await session.execute(history_pages.latest_id_statement(user_id))).scalar()
+        tag = history_pages.etag(user_id, latest_id, before_id, since_id, limit)
+        headers = {"Cache-Control": "private, no-cache"}
+        if conditional:
+            headers["ETag"] = f'"{tag}"'
+            if request.if_none_match.contains(tag):
+                return "", 304, headers
+
+        rows = (await session.execute(
+            history_pages.page_statement(user_id, before_id, limit, since_id)
+        )).all()
+
+    headers["Content-Type"] = "application/json"
+    payload = history_pages.page_payload if conditional else history_pages.legacy_payload
+    return fast_json.dumps(payload(rows, limit)), 200, headers
+
+
+# =====================
+# ADMIN
+# =====================
+
+@app.route("/admin/reload-knowledge", methods=["POST"])
+async def admin_reload_knowledge():
+    if not ADMIN_TOKEN or request.headers.get("X-Admin-Token") != ADMIN_TOKEN:
+        return jsonify({"error": "Forbidden"}), 403
+
+    # Re-encodes changed chunks; see rag_engine.reload_knowledge
+    return jsonify(await run_cpu(reload_knowledge))
+
+
+# =====================
+# STATS
+# =====================
+
+@app.route("/stats/emotion", methods=["GET"])
+async def emotion_stats():
+    return jsonify(batching_stats())
+
+
+@app.route("/stats/cache", methods=["GET"])
+async def query_cache_stats():
+    return jsonify({"rag_query": cache_stats(), "response": response_cache.stats()})
+
+
+@app.route("/stats/llm", methods=["GET"])
+async def llm_stats():
+    return jsonify(latency_stats())
+
+
+@app.route("/stats/conversations", methods=["GET"])
+async def conversation_stats():
+    return jsonify(dict(conversations.stats(), summary_folds=summarizer.folds))
+
+
+@app.route("/stats/admission", methods=["GET"])
+async def admission_stats():
+    return jsonify(chat_admission.stats())
+
+
+@app.route("/metrics", methods=["GET"])
+async def prometheus_metrics():
+    return Response(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+
+@app.route("/stats/startup", methods=["GET"])
+async def startup_stats():
+    return jsonify(lazy.status())
+
+
+@app.route("/stats/executor", methods=["GET"])
+async def executor_stats():
+    return jsonify({
+        "workers": INFERENCE_WORKERS,
+        "queue_limit": INFERENCE_QUEUE_LIMIT,
+        "queued": executor._work_queue.qsize()
+    })
@@ -1,20 +1,46 @@
-from flask_login import LoginManager, login_user, logout_user, login_required, current_user
-from flask_bcrypt import Bcrypt
+import os
+from flask_login import LoginManager, UserMixin, login_user, logout_user, login_required, current_user
 from flask import request, jsonify
 from models import User
 from db import db
+from password_hashing import hasher, HasherBusy
+from ttl_cache import TTLCache
 
 login_manager = LoginManager()
-bcrypt = Bcrypt()
+
+# Users loaded for authenticated requests (flask_login's user_loader)
+USER_CACHE_SIZE = int(os.getenv("USER_CACHE_SIZE", "4096"))
+USER_CACHE_TTL = float(os.getenv("USER_CACHE_TTL", "300"))
+
+user_cache = TTLCache(USER_CACHE_SIZE, USER_CACHE_TTL, name="users")
+
+
+class SessionUser(UserMixin):
+    # Detached copy of a User for current_user; holds no password hash and
+    # no SQLAlchemy state, so it is safe to share between requests.
+
+    def __init__(self, user):
+        self.id = user.id
+        self.username = user.username
 
 
 def init_auth(app):
     login_manager.init_app(app)
-    bcrypt.init_app(app)
 
     @login_manager.user_loader
     def load_user(user_id):
-        return User.query.get(int(user_id))
+        user_id = int(user_id)
+        cached = user_cache.get(user_id)
+        if cached is not None:
+            return cached
+
+        user = db.session.get(User, user_id)
+        if user is None:
+            return None
+
+        cached = SessionUser(user)
+        user_cache.put(user_id, cached)
+        return cached
 
 
 # =========================
@@ -32,9 +58,11 @@ def register_user():
     if existing_user:
         return jsonify({"error": "Username already exists"}), 400
 
-    hashed_password = bcrypt.generate_password_hash(
-        data["password"]
-    ).decode("utf-8")
+    # bcrypt runs in the hasher's process pool, off this request thread
+    try:
+        hashed_password = hasher.hash(data["password"])
+    except HasherBusy:
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
 
     new_user = User(
         username=data["username"],
@@ -59,8 +87,13 @@ def login_user_route():
     if not user:
         return jsonify({"error": "User not found"}), 404
 
-    if bcrypt.check_password_hash(user.password, data["password"]):
-        login_user(user)
+    try:
+        valid = hasher.check(user.password, data["password"])
+    except HasherBusy:
+        return jsonify({"error": "Server busy, please retry"}), 503, {"Retry-After": "1"}
+
+    if valid:
+        login_user(SessionUser(user))
         return jsonify({"message": "Login successful", "user_id": user.id}), 200
 
     return jsonify({"error": "Invalid credentials"}), 401
@@ -74,3 +107,7 @@ def login_user_route():
 def logout_user_route():
     logout_user()
     return jsonify({"message": "Logged out successfully"}), 200
+
+
+def auth_stats():
+    return {"password_hashing": hasher.stats(), "user_cache": user_cache.stats()}
@@ -0,0 +1,161 @@
+# Measures login throughput and /chat latency while logins are hammering
+# the same server. Start one backend per configuration and pass each URL:
+#
+#   CHAT_ADMISSION=0 PASSWORD_HASH_MODE=inline  gunicorn app:app -b :5001 --threads 8
+#   CHAT_ADMISSION=0 PASSWORD_HASH_MODE=process gunicorn app:app -b :5002 --threads 8
+#   python auth_benchmark.py --url inline=http://127.0.0.1:5001 \
+#                            --url process=http://127.0.0.1:5002
+#
+# For each URL /chat is measured alone (baseline), then again during a
+# storm of --logins concurrent logins. Point GROQ_BASE_URL at fake_groq.py
+# to keep the LLM out of the numbers.
+#
+# CHAT_ADMISSION=0 is required: the chat clients send far more than the
+# per-user and global rate limits allow, and timing 429s would measure
+# admission control rather than hashing. The benchmark checks
+# /stats/admission and refuses to run otherwise; any 429 that still
+# occurs is reported as "rejected", never as a latency sample.
+
+import argparse
+import json
+import threading
+import time
+import uuid
+import requests
+
+
+def _percentile(samples, p):
+    if not samples:
+        return None
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000.0
+
+
+def _latency(samples):
+    return {
+        "count": len(samples),
+        "p50_ms": _percentile(samples, 0.50),
+        "p99_ms": _percentile(samples, 0.99),
+        "max_ms": max(samples) * 1000.0 if samples else None
+    }
+
+
+def _chat_loop(url, user_id, stop, samples, errors, rejected, interval):
+    session = requests.Session()
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            res = session.post(f"{url}/chat", json={"message": "I feel a bit stressed today", "user_id": user_id}, timeout=60)
+            if res.status_code == 200:
+                samples.append(time.perf_counter() - started)
+            elif res.status_code == 429:
+                rejected.append(res.status_code)
+            else:
+                errors.append(res.status_code)
+        except requests.RequestException as e:
+            errors.append(type(e).__name__)
+        time.sleep(interval)
+
+
+def start_chat_clients(url, user_id, clients, interval):
+    stop = threading.Event()
+    samples, errors, rejected = [], [], []
+    threads = [
+        threading.Thread(target=_chat_loop, args=(url, user_id, stop, samples, errors, rejected, interval))
+        for _ in range(clients)
+    ]
+    for thread in threads:
+        thread.start()
+    return stop, threads, samples, errors, rejected
+
+
+def check_admission_disabled(url):
+    admission = requests.get(f"{url}/stats/admission", timeout=10).json()
+    if admission.get("enabled"):
+        raise SystemExit(f"{url} has chat admission control on; restart it with CHAT_ADMISSION=0")
+
+
+def login_storm(url, username, password, logins, concurrency):
+    done, failed = [0], [0]
+    lock = threading.Lock()
+    remaining = [logins]
+
+    def worker():
+        session = requests.Session()
+        while True:
+            with lock:
+                if remaining[0] <= 0:
+                    return
+                remaining[0] -= 1
+            try:
+                ok = session.post(f"{url}/login", json={"username": username, "password": password}, timeout=60).status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                if ok:
+                    done[0] += 1
+                else:
+                    failed[0] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    return {"logins": done[0], "failed": failed[0], "seconds": elapsed, "logins_per_second": done[0] / elapsed}
+
+
+def run(url, args):
+    check_admission_disabled(url)
+
+    username, password = f"bench-{uuid.uuid4().hex[:8]}", "bench-password"
+    requests.post(f"{url}/register", json={"username": username, "password": password}, timeout=60)
+    user_id = requests.post(f"{url}/login", json={"username": username, "password": password}, timeout=60).json()["user_id"]
+
+    # Baseline: chat alone
+    stop, threads, baseline, baseline_errors, baseline_rejected = start_chat_clients(url, user_id, args.chat_clients, args.chat_interval)
+    time.sleep(args.baseline_seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    # Chat during the login storm
+    stop, threads, storm, storm_errors, storm_rejected = start_chat_clients(url, user_id, args.chat_clients, args.chat_interval)
+    logins = login_storm(url, username, password, args.logins, args.login_concurrency)
+    stop.set()
+    for thread in threads:
+        thread.join()
+
+    return {
+        "login": logins,
+        "chat_baseline": dict(_latency(baseline), errors=len(baseline_errors), rejected=len(baseline_rejected)),
+        "chat_during_storm": dict(_latency(storm), errors=len(storm_errors), rejected=len(storm_rejected)),
+        "server": requests.get(f"{url}/stats/auth", timeout=10).json()
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Login storm vs /chat latency")
+    parser.add_argument("--url", action="append", required=True, help="name=http://host:port, repeatable")
+    parser.add_argument("--logins", type=int, default=200)
+    parser.add_argument("--login-concurrency", type=int, default=16)
+    parser.add_argument("--chat-clients", type=int, default=4)
+    parser.add_argument("--chat-interval", type=float, default=0.05)
+    parser.add_argument("--baseline-seconds", type=float, default=5.0)
+    args = parser.parse_args()
+
+    report = {}
+    for spec in args.url:
+        name, _, url = spec.partition("=")
+        if not url:
+            name, url = spec, spec
+        report[name] = run(url.rstrip("/"), args)
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,156 @@
+import threading
+import time
+from collections import defaultdict
+
+
+class _Pending:
+    __slots__ = ("item", "enqueued_at", "done", "result", "error")
+
+    def __init__(self, item):
+        self.item = item
+        self.enqueued_at = time.perf_counter()
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Collects concurrent single-item calls into batches.
+
+    Callers block in ``submit`` while a background worker waits up to
+    ``max_wait_ms`` for more work (or until ``max_batch_size`` items are
+    queued), splits the batch into length buckets and hands each bucket to
+    ``run_batch`` in one call.
+    """
+
+    def __init__(self, run_batch, max_batch_size=16, max_wait_ms=5.0,
+                 bucket_key=None):
+        self.run_batch = run_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self.bucket_key = bucket_key or (lambda item: 0)
+
+        self._queue = []
+        self._cond = threading.Condition()
+        self._worker = None
+
+        self._stats_lock = threading.Lock()
+        self._batches = 0
+        self._forward_passes = 0
+        self._items = 0
+        self._max_batch = 0
+        self._batch_sizes = defaultdict(int)
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    # =========================
+    # PUBLIC API
+    # =========================
+
+    def submit(self, item):
+        pending = _Pending(item)
+
+        with self._cond:
+            self._ensure_worker()
+            self._queue.append(pending)
+            self._cond.notify()
+
+        pending.done.wait()
+
+        if pending.error is not None:
+            raise pending.error
+        return pending.result
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self._batches
+            return {
+                "batches": batches,
+                "forward_passes": self._forward_passes,
+                "items": self._items,
+                "avg_batch_size": self._items / batches if batches else 0.0,
+                "max_batch_size_seen": self._max_batch,
+                "batch_size_histogram": dict(sorted(self._batch_sizes.items())),
+                "avg_wait_ms": (self._wait_total / self._items * 1000.0) if self._items else 0.0,
+                "max_wait_ms": self._wait_max * 1000.0,
+                "config": {
+                    "max_batch_size": self.max_batch_size,
+                    "max_wait_ms": self.max_wait * 1000.0,
+                },
+            }
+
+    # =========================
+    # WORKER
+    # =========================
+
+    def _ensure_worker(self):
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(
+                target=self._loop, name="micro-batcher", daemon=True
+            )
+            self._worker.start()
+
+    def _collect(self):
+        with self._cond:
+            while not self._queue:
+                self._cond.wait()
+
+            deadline = time.perf_counter() + self.max_wait
+            while len(self._queue) < self.max_batch_size:
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+
+            batch = self._queue[:self.max_batch_size]
+            del self._queue[:self.max_batch_size]
+            return batch
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._run_batch(batch)
+            except Exception as e:
+                # Never let the single worker die: callers would wait forever
+                for pending in batch:
+                    if not pending.done.is_set():
+                        pending.error = e
+                        pending.done.set()
+
+    def _run_batch(self, batch):
+        started = time.perf_counter()
+
+        buckets = defaultdict(list)
+        for pending in batch:
+            buckets[self.bucket_key(pending.item)].append(pending)
+
+        for key in sorted(buckets):
+            self._run_bucket(buckets[key])
+
+        self._record(batch, len(buckets), started)
+
+    def _run_bucket(self, bucket):
+        try:
+            results = self.run_batch([p.item for p in bucket])
+            for pending, result in zip(bucket, results):
+                pending.result = result
+        except Exception as e:
+            for pending in bucket:
+                pending.error = e
+        finally:
+            for pending in bucket:
+                pending.done.set()
+
+    def _record(self, batch, passes, started):
+        with self._stats_lock:
+            size = len(batch)
+            self._batches += 1
+            self._forward_passes += passes
+            self._items += size
+            self._max_batch = max(self._max_batch, size)
+            self._batch_sizes[size] += 1
+            for pending in batch:
+                waited = started - pending.enqueued_at
+                self._wait_total += waited
+                self._wait_max = max(self._wait_max, waited)
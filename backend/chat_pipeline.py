@@ -0,0 +1,276 @@
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from metrics import stage_seconds
+import lazy
+import request_trace
+
+# Extra seconds a stage call gets when it has to load a model first (the
+# first requests after a start without WARMUP_MODELS); the stage timeouts
+# are sized for inference, not for loading
+COLD_START_TIMEOUT = float(os.getenv("PIPELINE_COLD_START_TIMEOUT", "120"))
+
+
+class StageTimeout(Exception):
+    pass
+
+
+class Stage:
+    """One step of the chat pipeline with its own threads, limit and timeout.
+
+    ``fallback`` is called with the same arguments when the stage times out,
+    is over its concurrency limit for longer than the timeout, or raises.
+    Without a fallback those conditions propagate to the caller. Time spent
+    loading a lazy model on first use does not count against the timeout.
+    """
+
+    def __init__(self, name, func, workers=4, max_concurrency=16, timeout=10.0, fallback=None):
+        self.name = name
+        self.func = func
+        self.timeout = timeout
+        self.fallback = fallback
+        self.max_concurrency = max_concurrency
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"stage-{name}")
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._histogram = stage_seconds.labels(name)
+
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.timeouts = 0
+        self.errors = 0
+        self.rejected = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    @classmethod
+    def from_env(cls, name, func, workers, max_concurrency, timeout, fallback=None):
+        prefix = f"PIPELINE_{name.upper()}_"
+        return cls(
+            name,
+            func,
+            workers=int(os.getenv(prefix + "WORKERS", str(workers))),
+            max_concurrency=int(os.getenv(prefix + "CONCURRENCY", str(max_concurrency))),
+            timeout=float(os.getenv(prefix + "TIMEOUT", str(timeout))),
+            fallback=fallback
+        )
+
+    def submit(self, *args):
+        call = _Call(self, args)
+
+        if not self._slots.acquire(timeout=self.timeout):
+            with self._lock:
+                self.rejected += 1
+            call.error = StageTimeout(f"{self.name}: over concurrency limit")
+            return call
+
+        try:
+            call.future = self._executor.submit(request_trace.bind(_run), call, self.func, *args)
+        except Exception:
+            self._slots.release()
+            raise
+        call.future.add_done_callback(call.done)
+        return call
+
+    def run(self, *args):
+        return self.submit(*args).result()
+
+    def _fail(self, error, args):
+        if self.fallback is None:
+            raise error
+        print(f"Pipeline stage {error}; using fallback", flush=True)
+        return self.fallback(*args)
+
+    def record(self, seconds):
+        self._histogram.observe(seconds)
+        request_trace.record_timing(self.name, seconds)
+        with self._lock:
+            self.calls += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "calls": self.calls,
+                "avg_ms": self.total / self.calls * 1000.0 if self.calls else 0.0,
+                "max_ms": self.max * 1000.0,
+                "timeouts": self.timeouts,
+                "errors": self.errors,
+                "rejected": self.rejected,
+                "max_concurrency": self.max_concurrency,
+                "timeout_s": self.timeout
+            }
+
+
+def _run(call, func, *args):
+    with lazy.on_first_load(call.cold_start):
+        return func(*args)
+
+
+class _Call:
+    __slots__ = ("stage", "args", "started", "finished", "future", "error", "cold")
+
+    def __init__(self, stage, args):
+        self.stage = stage
+        self.args = args
+        self.started = time.perf_counter()
+        self.finished = None
+        self.future = None
+        self.error = None
+        self.cold = False
+
+    def cold_start(self, name):
+        self.cold = True
+
+    def done(self, _):
+        self.finished = time.perf_counter()
+        self.stage._slots.release()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def result(self):
+        stage = self.stage
+
+        if self.error is None:
+            remaining = stage.timeout - (time.perf_counter() - self.started)
+            try:
+                try:
+                    result = self.future.result(timeout=max(0.0, remaining))
+                except FutureTimeout:
+                    if not self.cold:
+                        raise
+                    result = self.future.result(timeout=COLD_START_TIMEOUT)
+                stage.record(self.elapsed)
+                return result
+            except FutureTimeout:
+                with stage._lock:
+                    stage.timeouts += 1
+                self.error = StageTimeout(f"{stage.name}: timed out")
+            except Exception as e:
+                with stage._lock:
+                    stage.errors += 1
+                self.error = e
+
+        stage.record(self.elapsed)
+        return stage._fail(self.error, self.args)
+
+
+class Turn:
+    __slots__ = ("message", "crisis", "emotion", "context", "reply", "timings", "started")
+
+    def __init__(self, message):
+        self.message = message
+        self.crisis = False
+        self.emotion = None
+        self.context = None
+        self.reply = None
+        self.timings = {}
+        self.started = time.perf_counter()
+
+
+def _unsaved(turn, *persist_args):
+    # No row to show for this turn in /history; the user still gets the reply
+    print(f"Conversation turn not saved ({len(turn.reply or '')} char reply)", flush=True)
+
+
+def _timed(turn, name, call):
+    try:
+        return call.result()
+    finally:
+        # The stage's own duration, even when collected after another stage
+        turn.timings[name] = call.elapsed * 1000.0
+
+
+class ChatPipeline:
+    """crisis check -> (emotion || retrieval) -> LLM -> persistence
+
+    The stage functions take the message object passed to ``run`` (plain
+    text in the Streamlit app, MessageFeatures in the backend):
+
+        crisis(message) -> bool
+        emotion(message) -> label
+        retrieve(message) -> context
+        generate(message, emotion, history, context) -> reply
+        persist(turn, *persist_args)
+    """
+
+    def __init__(self, crisis, emotion, retrieve, generate=None, persist=None,
+                 crisis_reply="", crisis_fallback=None, fallback_reply=""):
+        self.crisis_reply = crisis_reply
+        self.crisis = Stage.from_env("crisis", crisis, 4, 32, 2.0, fallback=crisis_fallback)
+        self.emotion = Stage.from_env("emotion", emotion, 8, 32, 5.0, fallback=lambda *a: "neutral")
+        self.retrieval = Stage.from_env("retrieval", retrieve, 4, 32, 3.0, fallback=lambda *a: [])
+        self.llm = None
+        if generate is not None:
+            self.llm = Stage.from_env("llm", generate, 16, 64, 30.0, fallback=lambda *a: fallback_reply)
+        self.persistence = None
+        if persist is not None:
+            # Longer than SQLite's 5s busy timeout, so a locked database
+            # fails inside the write rather than here; either way the reply
+            # is still returned and the failed write only logged
+            self.persistence = Stage.from_env("persist", persist, 2, 16, 10.0, fallback=_unsaved)
+
+        self._lock = threading.Lock()
+        self.turns = 0
+        self.total = 0.0
+
+    def prepare(self, message):
+        turn = Turn(message)
+
+        if _timed(turn, "crisis", self.crisis.submit(message)):
+            turn.crisis = True
+            turn.emotion = "critical"
+            turn.reply = self.crisis_reply
+            return turn
+
+        # Independent of each other, so they run side by side
+        emotion = self.emotion.submit(message)
+        retrieval = self.retrieval.submit(message)
+        turn.emotion = _timed(turn, "emotion", emotion)
+        turn.context = _timed(turn, "retrieval", retrieval)
+
+        return turn
+
+    def generate(self, turn, history):
+        turn.reply = _timed(
+            turn, "llm",
+            self.llm.submit(turn.message, turn.emotion, history, turn.context)
+        )
+        return turn.reply
+
+    def record_llm(self, turn, seconds):
+        # For callers that stream the reply themselves instead of generate()
+        turn.timings["llm"] = seconds * 1000.0
+        if self.llm is not None:
+            self.llm.record(seconds)
+
+    def persist(self, turn, *persist_args):
+        if self.persistence is not None:
+            _timed(turn, "persist", self.persistence.submit(turn, *persist_args))
+
+    def finish(self, turn):
+        turn.timings["total"] = (time.perf_counter() - turn.started) * 1000.0
+        with self._lock:
+            self.turns += 1
+            self.total += turn.timings["total"]
+        return turn
+
+    def run(self, message, history, *persist_args):
+        turn = self.prepare(message)
+        if not turn.crisis:
+            self.generate(turn, history)
+            self.persist(turn, *persist_args)
+        return self.finish(turn)
+
+    def stats(self):
+        stages = [self.crisis, self.emotion, self.retrieval, self.llm, self.persistence]
+        with self._lock:
+            turns, total = self.turns, self.total
+        return {
+            "turns": turns,
+            "avg_total_ms": total / turns if turns else 0.0,
+            "stages": {stage.name: stage.stats() for stage in stages if stage is not None}
+        }
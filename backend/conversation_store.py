@@ -0,0 +1,208 @@
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+
+# Recent turns kept per user. Older turns are dropped once the rolling
+# summary covers them; turns the summarizer has not reached yet are kept
+# up to twice this many.
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "20"))
+
+# Global budget for all in-memory conversations, and idle expiry per user
+CONVERSATION_MEMORY_MB = float(os.getenv("CONVERSATION_MEMORY_MB", "64"))
+CONVERSATION_TTL = float(os.getenv("CONVERSATION_TTL", "3600"))
+CONVERSATION_MAX_USERS = int(os.getenv("CONVERSATION_MAX_USERS", "10000"))
+
+
+class ChatTurn:
+    # Text is kept UTF-8 encoded: replies usually contain an emoji, which
+    # makes CPython store the whole str at 4 bytes per character.
+    __slots__ = ("_message", "_reply", "emotion", "seq")
+
+    def __init__(self, message, reply, emotion=None, seq=0):
+        self._message = message.encode("utf-8")
+        self._reply = reply.encode("utf-8")
+        self.emotion = emotion
+        self.seq = seq  # position in the whole conversation, from 0
+
+    @property
+    def message(self):
+        return self._message.decode("utf-8")
+
+    @property
+    def reply(self):
+        return self._reply.decode("utf-8")
+
+    @property
+    def size(self):
+        return sys.getsizeof(self) + sys.getsizeof(self._message) + sys.getsizeof(self._reply)
+
+
+class History:
+    # What a prompt needs from a conversation: the recent turns (oldest
+    # first) plus the rolling summary of turns before seq `summarized`.
+    __slots__ = ("turns", "summary", "summarized")
+
+    def __init__(self, turns=(), summary="", summarized=0):
+        self.turns = turns
+        self.summary = summary
+        self.summarized = summarized
+
+    def __len__(self):
+        return len(self.turns)
+
+    def __iter__(self):
+        return iter(self.turns)
+
+
+class _Conversation:
+    __slots__ = ("turns", "size", "last_seen", "count", "summary", "summarized")
+
+    def __init__(self):
+        self.turns = deque()
+        self.size = 0
+        self.last_seen = time.monotonic()
+        self.count = 0
+        self.summary = ""
+        self.summarized = 0
+
+
+class ConversationStore:
+    """In-memory chat history per user, bounded in turns, users and bytes.
+
+    Users are kept in LRU order; the least recently active are evicted when
+    the memory budget or user cap is exceeded, and users idle for longer
+    than ``ttl`` seconds expire.
+    """
+
+    def __init__(self, max_turns=CONVERSATION_MAX_TURNS, max_bytes=int(CONVERSATION_MEMORY_MB * 1024 * 1024),
+                 ttl=CONVERSATION_TTL, max_users=CONVERSATION_MAX_USERS):
+        self.max_turns = max(1, max_turns)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.max_users = max(1, max_users)
+        self._users = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.dropped_turns = 0
+        self.lost_turns = 0
+
+    def _expired(self, conversation, now):
+        return self.ttl > 0 and now - conversation.last_seen > self.ttl
+
+    def _remove(self, user_id):
+        conversation = self._users.pop(user_id)
+        self.bytes -= conversation.size
+
+    def _expire(self, now):
+        # LRU order means expired users are all at the front
+        while self._users:
+            user_id, conversation = next(iter(self._users.items()))
+            if not self._expired(conversation, now):
+                break
+            self._remove(user_id)
+            self.expirations += 1
+
+    def _trim(self, conversation):
+        turns = conversation.turns
+        while len(turns) > self.max_turns and (
+            turns[0].seq < conversation.summarized or len(turns) > 2 * self.max_turns
+        ):
+            turn = turns.popleft()
+            if turn.seq >= conversation.summarized:
+                self.lost_turns += 1  # the summarizer fell too far behind
+            conversation.size -= turn.size
+            self.bytes -= turn.size
+            self.dropped_turns += 1
+
+    def _evict(self, keep):
+        while self._users and (self.bytes > self.max_bytes or len(self._users) > self.max_users):
+            user_id = next(iter(self._users))
+            if user_id == keep:
+                break
+            self._remove(user_id)
+            self.evictions += 1
+
+    def history(self, user_id):
+        # Snapshot of the user's conversation as a History
+        now = time.monotonic()
+        with self._lock:
+            conversation = self._users.get(user_id)
+            if conversation is None:
+                return History()
+            if self._expired(conversation, now):
+                self._remove(user_id)
+                self.expirations += 1
+                return History()
+            return History(tuple(conversation.turns), conversation.summary, conversation.summarized)
+
+    def append(self, user_id, message, reply, emotion=None):
+        now = time.monotonic()
+
+        with self._lock:
+            self._expire(now)
+
+            conversation = self._users.get(user_id)
+            if conversation is None:
+                conversation = self._users[user_id] = _Conversation()
+            self._users.move_to_end(user_id)
+
+            turn = ChatTurn(message, reply, emotion, conversation.count)
+            size = turn.size
+            conversation.count += 1
+
+            conversation.turns.append(turn)
+            conversation.size += size
+            conversation.last_seen = now
+            self.bytes += size
+            self._trim(conversation)
+
+            self._evict(keep=user_id)
+
+        return turn
+
+    def set_summary(self, user_id, summary, summarized):
+        # summarized: seq of the first turn not covered by the summary
+        with self._lock:
+            conversation = self._users.get(user_id)
+            if conversation is None or summarized <= conversation.summarized:
+                return False
+
+            delta = sys.getsizeof(summary) - sys.getsizeof(conversation.summary)
+            conversation.summary = summary
+            conversation.summarized = summarized
+            conversation.size += delta
+            self.bytes += delta
+            self._trim(conversation)
+            return True
+
+    def clear(self, user_id):
+        with self._lock:
+            if user_id in self._users:
+                self._remove(user_id)
+
+    def __len__(self):
+        return len(self._users)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "users": len(self._users),
+                "max_users": self.max_users,
+                "turns": sum(len(c.turns) for c in self._users.values()),
+                "max_turns_per_user": self.max_turns,
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "dropped_turns": self.dropped_turns,
+                "lost_turns": self.lost_turns
+            }
+
+
+conversations = ConversationStore()
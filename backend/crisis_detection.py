@@ -1,3 +1,67 @@
+import os
+import numpy as np
+from lazy import Lazy
+from crisis_lexicon import is_crisis
+
+crisis_phrases_path = os.getenv(
+    "CRISIS_PHRASES_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "crisis_phrases.txt")
+)
+
+# Cosine similarity to the nearest crisis phrase that counts as a match
+CRISIS_SIMILARITY_THRESHOLD = float(os.getenv("CRISIS_SIMILARITY_THRESHOLD", "0.62"))
+CRISIS_SEMANTIC = os.getenv("CRISIS_SEMANTIC", "1") == "1"
+
+CRISIS_REPLY = "I'm really concerned. Please contact a trusted person or local helpline immediately."
+
+
 def crisis_detection(text):
-    keywords = ["suicide", "kill myself", "end my life", "hopeless"]
-    return any(word in text.lower() for word in keywords)
+    return is_crisis(text)
+
+
+# =========================
+# EMBEDDING SIMILARITY
+# =========================
+
+def _load_phrase_matrix():
+    import rag_engine
+    from embedding_cache import encode_with_cache
+
+    with open(crisis_phrases_path, "r", encoding="utf-8") as f:
+        phrases = list(dict.fromkeys(line.strip() for line in f if line.strip()))
+
+    embeddings = np.array(encode_with_cache(
+        rag_engine.EMBEDDING_MODEL_NAME,
+        lambda lines: rag_engine.model.get().encode(lines),
+        [rag_engine.normalize_query(p) for p in phrases],
+        corpus="crisis"
+    ), dtype=np.float32)
+    embeddings /= np.linalg.norm(embeddings, axis=1, keepdims=True)
+
+    return phrases, embeddings
+
+
+crisis_matrix = Lazy("crisis_phrases", _load_phrase_matrix)
+
+
+def semantic_crisis_match(features):
+    phrases, matrix = crisis_matrix.get()
+
+    vector = np.asarray(features.embedding, dtype=np.float32).reshape(-1)
+    vector = vector / (np.linalg.norm(vector) or 1.0)
+
+    scores = matrix @ vector
+    best = int(np.argmax(scores))
+    score = float(scores[best])
+
+    if score >= CRISIS_SIMILARITY_THRESHOLD:
+        return phrases[best], score
+    return None
+
+
+def detect_crisis(features):
+    if crisis_detection(features.text):
+        return True
+    if CRISIS_SEMANTIC and semantic_crisis_match(features) is not None:
+        return True
+    return False
@@ -0,0 +1,216 @@
+import os
+from collections import deque, namedtuple
+from lazy import Lazy
+
+crisis_lexicon_path = os.getenv(
+    "CRISIS_LEXICON_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "crisis_lexicon.txt")
+)
+
+# A cue negates a match only when it governs the phrase: directly before
+# it ("not hopeless", "don't want to die") or separated by at most
+# NEGATION_WINDOW linking words ("never going to hurt myself"). Anything
+# else in between ("can't cope I want to die", "why not just kill
+# myself") leaves the match a crisis; a missed negation costs a helpline
+# reply, a false one can cost far more.
+NEGATION_CUES = {"not", "never", "no", "dont", "wont", "cant", "isnt", "wasnt", "nor", "without"}
+NEGATION_LINKS = {
+    "want", "wanna", "going", "gonna", "to", "ever", "really", "feel", "feeling",
+    "am", "im", "be", "being", "will", "would", "actually", "even", "trying", "planning"
+}
+# "why not kill myself" asks, it does not negate
+RHETORICAL_CUES = {"why", "or"}
+NEGATION_WINDOW = int(os.getenv("CRISIS_NEGATION_WINDOW", "3"))
+
+# Digits/symbols read as letters when they appear inside a word ("k1ll")
+LEET = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s", "!": "i"}
+APOSTROPHES = {"'", "’", "‘", "`"}
+IGNORED = {"​", "‌", "‍", "﻿", "­"}
+CLAUSE_BREAKS = {".", ",", ";", ":", "!", "?", "\n"}
+
+WORD_SEP = " "
+CLAUSE_SEP = "|"
+
+CrisisMatch = namedtuple("CrisisMatch", ["phrase", "start", "end", "negated"])
+
+
+def normalize(text):
+    # Returns the normalized text plus, for every normalized character, the
+    # offset of the original character it came from.
+    chars = []
+    offsets = []
+    length = len(text)
+
+    for i, c in enumerate(text):
+        if c in IGNORED or c in APOSTROPHES:
+            continue
+
+        c = c.lower()
+        if c in LEET:
+            prev_alpha = i > 0 and text[i - 1].isalpha()
+            next_alpha = i + 1 < length and text[i + 1].isalpha()
+            inside_word = (prev_alpha and next_alpha) if c == "!" else (prev_alpha or next_alpha)
+            if inside_word:
+                c = LEET[c]
+
+        if c.isalnum():
+            chars.append(c)
+            offsets.append(i)
+            continue
+
+        sep = CLAUSE_SEP if c in CLAUSE_BREAKS else WORD_SEP
+        if chars and chars[-1] in (WORD_SEP, CLAUSE_SEP):
+            if sep == CLAUSE_SEP:
+                chars[-1] = CLAUSE_SEP
+            continue
+        if chars:
+            chars.append(sep)
+            offsets.append(i)
+
+    return "".join(chars), offsets
+
+
+def _is_sep(c):
+    return c == WORD_SEP or c == CLAUSE_SEP
+
+
+class CrisisLexicon:
+    """Aho-Corasick automaton over the normalized crisis phrases."""
+
+    def __init__(self, phrases):
+        self.phrases = []
+        self.prefix_only = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+
+        for phrase in phrases:
+            prefix = phrase.endswith("*")
+            normalized, _ = normalize(phrase.rstrip("*"))
+            normalized = normalized.strip(WORD_SEP + CLAUSE_SEP)
+            if not normalized:
+                continue
+            self.phrases.append(phrase)
+            self.prefix_only.append(prefix)
+            self._insert(normalized, len(self.phrases) - 1)
+
+        self._build_links()
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, "r", encoding="utf-8") as f:
+            return cls(
+                line.strip() for line in f
+                if line.strip() and not line.lstrip().startswith("#")
+            )
+
+    def _insert(self, normalized, phrase_id):
+        state = 0
+        for c in normalized:
+            nxt = self._goto[state].get(c)
+            if nxt is None:
+                nxt = len(self._goto)
+                self._goto[state][c] = nxt
+                self._goto.append({})
+                self._fail.append(0)
+                self._out.append([])
+            state = nxt
+        self._out[state].append((phrase_id, len(normalized)))
+
+    def _build_links(self):
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for c, nxt in self._goto[state].items():
+                queue.append(nxt)
+                fallback = self._fail[state]
+                while fallback and c not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(c, 0)
+                self._out[nxt] = self._out[nxt] + self._out[self._fail[nxt]]
+
+    def find(self, text):
+        normalized, offsets = normalize(text)
+        matches = []
+        state = 0
+        goto, fail, out = self._goto, self._fail, self._out
+        last = len(normalized) - 1
+
+        for pos, c in enumerate(normalized):
+            while state and c not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(c, 0)
+
+            for phrase_id, size in out[state]:
+                start = pos - size + 1
+                if start > 0 and not _is_sep(normalized[start - 1]):
+                    continue
+                if not self.prefix_only[phrase_id] and pos < last and not _is_sep(normalized[pos + 1]):
+                    continue
+
+                end = pos
+                while end < last and not _is_sep(normalized[end + 1]):
+                    end += 1
+
+                matches.append(CrisisMatch(
+                    phrase=self.phrases[phrase_id],
+                    start=offsets[start],
+                    end=offsets[end] + 1,
+                    negated=_negated(normalized, start)
+                ))
+
+        return matches
+
+
+def _negated(normalized, start):
+    if NEGATION_WINDOW <= 0:
+        return False
+    clause = normalized[:start].rsplit(CLAUSE_SEP, 1)[-1]
+    words = clause.split()
+
+    links = 0
+    for i in range(len(words) - 1, -1, -1):
+        word = words[i]
+        if word in NEGATION_CUES:
+            return not (i > 0 and words[i - 1] in RHETORICAL_CUES)
+        if word not in NEGATION_LINKS or links >= NEGATION_WINDOW:
+            return False
+        links += 1
+    return False
+
+
+lexicon = Lazy("crisis_lexicon", lambda: CrisisLexicon.from_file(crisis_lexicon_path))
+
+
+def find_crisis_phrases(text):
+    return lexicon.get().find(text)
+
+
+def is_crisis(text):
+    return any(not match.negated for match in find_crisis_phrases(text))
+
+
+# Regression cases for the negation rule; run "python crisis_lexicon.py"
+# after editing the lexicon or the cue lists.
+CHECKS = [
+    ("I can't cope I want to die", True),
+    ("I can't help but want to die", True),
+    ("why not just kill myself", True),
+    ("why not kill myself", True),
+    ("I can't stop thinking I want to die", True),
+    ("I don't want to die but I want to kill myself", True),
+    ("I want to kill myself", True),
+    ("I feel hopeless", True),
+    ("I don't want to die", False),
+    ("I'm not hopeless anymore", False),
+    ("I'm not going to hurt myself", False),
+    ("I would never kill myself", False),
+]
+
+
+if __name__ == "__main__":
+    failed = [(text, expected) for text, expected in CHECKS if is_crisis(text) != expected]
+    for text, expected in failed:
+        print(f"FAIL: is_crisis({text!r}) should be {expected}")
+    print(f"{len(CHECKS) - len(failed)}/{len(CHECKS)} crisis lexicon checks passed")
+    raise SystemExit(1 if failed else 0)
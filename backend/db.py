@@ -1,8 +1,126 @@
+import os
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import make_url
 
 db = SQLAlchemy()
 
+# Any SQLAlchemy URL. Relative SQLite paths resolve against the Flask
+# instance folder, as before.
+DATABASE_URI = os.getenv("DATABASE_URL", "sqlite:///database.db")
+
+# "tuned" applies the settings below; "default" leaves the driver defaults
+# (kept for comparison, see db_benchmark.py).
+DB_PROFILE = os.getenv("DB_PROFILE", "tuned")
+
+# Applied to every new SQLite connection. WAL lets readers run alongside
+# the single writer, and synchronous=NORMAL is safe in WAL mode (a crash can
+# lose the last transactions, never corrupt the file).
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "mmap_size": int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    "cache_size": int(os.getenv("SQLITE_CACHE_SIZE", "-65536")),  # negative = KiB
+    "temp_store": "MEMORY"
+}
+
+# Connection pool for server databases (PostgreSQL, MySQL, ...)
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+# Async drivers used by the ASGI app when the URL names none
+ASYNC_DRIVERS = {
+    "sqlite": "sqlite+aiosqlite",
+    "postgresql": "postgresql+asyncpg",
+    "mysql": "mysql+aiomysql"
+}
+
+
+def is_sqlite(uri):
+    return make_url(uri).get_backend_name() == "sqlite"
+
+
+def engine_options(uri=DATABASE_URI, profile=DB_PROFILE):
+    if profile != "tuned":
+        return {}
+
+    if is_sqlite(uri):
+        # sqlite3's own lock wait, in seconds, on top of busy_timeout
+        return {"connect_args": {"timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000.0}}
+
+    return {
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": True
+    }
+
+
+def apply_sqlite_pragmas(dbapi_connection, pragmas=SQLITE_PRAGMAS):
+    cursor = dbapi_connection.cursor()
+    for name, value in pragmas.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+
+def configure_engine(engine, profile=DB_PROFILE):
+    # Call before the engine's first connection. For async engines pass
+    # engine.sync_engine.
+    if profile == "tuned" and engine.dialect.name == "sqlite":
+        event.listen(engine, "connect", lambda dbapi_connection, record: apply_sqlite_pragmas(dbapi_connection))
+    return engine
+
+
 def init_db(app):
-    app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///database.db'
+    app.config['SQLALCHEMY_DATABASE_URI'] = DATABASE_URI
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(DATABASE_URI)
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     db.init_app(app)
+
+    with app.app_context():
+        configure_engine(db.engine)
+
+
+def async_database_uri(instance_path, uri=DATABASE_URI):
+    # Same database through an async driver. Flask-SQLAlchemy resolves a
+    # relative SQLite path against the app's instance folder; do the same.
+    url = make_url(uri)
+    backend = url.get_backend_name()
+
+    if backend == "sqlite" and url.database and url.database != ":memory:" and not os.path.isabs(url.database):
+        url = url.set(database=os.path.join(instance_path, url.database))
+
+    if url.drivername == backend and backend in ASYNC_DRIVERS:
+        url = url.set(drivername=ASYNC_DRIVERS[backend])
+
+    return url.render_as_string(hide_password=False)
+
+
+def upgrade_schema(connection):
+    # create_all() only creates missing tables; bring databases created
+    # before created_at and the (user_id, id) index up to date.
+    inspector = inspect(connection)
+    if "conversation" not in inspector.get_table_names():
+        return
+
+    # DDL is rendered through the connection's dialect (DATETIME on SQLite,
+    # TIMESTAMP WITHOUT TIME ZONE on PostgreSQL, ...)
+    table = db.metadata.tables["conversation"]
+    preparer = connection.dialect.identifier_preparer
+
+    columns = {column["name"] for column in inspector.get_columns("conversation")}
+    if "created_at" not in columns:
+        column = table.c.created_at
+        connection.execute(text(
+            f"ALTER TABLE {preparer.format_table(table)} "
+            f"ADD COLUMN {preparer.format_column(column)} {column.type.compile(dialect=connection.dialect)}"
+        ))
+
+    indexes = {index["name"] for index in inspector.get_indexes("conversation")}
+    for index in table.indexes:
+        if index.name not in indexes:
+            index.create(connection)
@@ -0,0 +1,164 @@
+import glob
+import hashlib
+import json
+import os
+import re
+import numpy as np
+
+# Bump when the on-disk layout changes; older artifacts are then ignored.
+FORMAT_VERSION = 1
+
+CACHE_DIR = os.getenv(
+    "EMBEDDING_CACHE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "embeddings")
+)
+
+META_FILE = "meta.json"
+
+
+def line_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def _digest(hashes):
+    return hashlib.sha256("\n".join(hashes).encode("utf-8")).hexdigest()[:16]
+
+
+def _safe(name):
+    return re.sub(r"[^A-Za-z0-9_.-]+", "_", name)
+
+
+def _model_dir(model_name, cache_dir, corpus):
+    # One metadata slot per corpus and model: corpora embedded with the same
+    # model (the knowledge base, the crisis phrases, the Streamlit app's
+    # knowledge list) must not overwrite each other's artifacts
+    return os.path.join(cache_dir, _safe(corpus), _safe(model_name))
+
+
+def _read_meta(directory, model_name):
+    try:
+        with open(os.path.join(directory, META_FILE), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+
+    if meta.get("version") != FORMAT_VERSION or meta.get("model") != model_name:
+        return None
+    return meta
+
+
+def _write_meta(directory, meta):
+    tmp_path = os.path.join(directory, f"{META_FILE}.{os.getpid()}.tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(meta, f)
+    os.replace(tmp_path, os.path.join(directory, META_FILE))
+
+
+def _remove_stale(directory, pattern, keep):
+    for path in glob.glob(os.path.join(directory, pattern)):
+        if os.path.basename(path) not in keep:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+# =========================
+# EMBEDDINGS
+# =========================
+
+def encode_with_cache(model_name, encode, lines, cache_dir=CACHE_DIR, corpus="default"):
+    """Return float32 embeddings for ``lines``, encoding only uncached ones.
+
+    ``encode`` is only called (and the model therefore only loaded) when at
+    least one line is new or changed. When nothing changed the returned
+    matrix is a read-only memory map of the artifact.
+    """
+    directory = _model_dir(model_name, cache_dir, corpus)
+    os.makedirs(directory, exist_ok=True)
+
+    hashes = [line_hash(line) for line in lines]
+    meta = _read_meta(directory, model_name)
+
+    cached = None
+    rows = {}
+    if meta is not None:
+        try:
+            cached = np.load(os.path.join(directory, meta["embeddings"]), mmap_mode="r")
+            rows = {h: i for i, h in enumerate(meta["hashes"])}
+        except (OSError, ValueError, KeyError):
+            cached, rows = None, {}
+
+    if cached is not None and meta["hashes"] == hashes:
+        return cached
+
+    missing = [i for i, h in enumerate(hashes) if h not in rows]
+    fresh = None
+    if missing:
+        fresh = np.asarray(encode([lines[i] for i in missing]), dtype=np.float32)
+        if fresh.ndim == 1:
+            fresh = np.expand_dims(fresh, axis=0)
+
+    dimension = fresh.shape[1] if fresh is not None else cached.shape[1]
+    embeddings = np.empty((len(lines), dimension), dtype=np.float32)
+
+    fresh_rows = {i: n for n, i in enumerate(missing)}
+    for i, h in enumerate(hashes):
+        if i in fresh_rows:
+            embeddings[i] = fresh[fresh_rows[i]]
+        else:
+            embeddings[i] = cached[rows[h]]
+
+    digest = _digest(hashes)
+    embeddings_file = f"embeddings-{digest}.npy"
+    tmp_path = os.path.join(directory, f"{embeddings_file}.{os.getpid()}.tmp")
+    with open(tmp_path, "wb") as f:
+        np.save(f, embeddings)
+    os.replace(tmp_path, os.path.join(directory, embeddings_file))
+
+    _write_meta(directory, {
+        "version": FORMAT_VERSION,
+        "model": model_name,
+        "dimension": dimension,
+        "hashes": hashes,
+        "embeddings": embeddings_file,
+        "indexes": {}
+    })
+    _remove_stale(directory, "embeddings-*.npy", {embeddings_file})
+    _remove_stale(directory, "index-*.faiss", set())
+
+    return embeddings
+
+
+# =========================
+# FAISS INDEX
+# =========================
+
+def cached_index(model_name, lines, build, kind="flat", cache_dir=CACHE_DIR, corpus="default"):
+    """Load the saved FAISS index for ``lines`` or build and save it."""
+    import faiss
+
+    directory = _model_dir(model_name, cache_dir, corpus)
+    meta = _read_meta(directory, model_name)
+    hashes = [line_hash(line) for line in lines]
+
+    if meta is not None and meta["hashes"] == hashes:
+        index_file = meta.get("indexes", {}).get(kind)
+        if index_file:
+            try:
+                return faiss.read_index(os.path.join(directory, index_file), faiss.IO_FLAG_MMAP)
+            except RuntimeError:
+                pass
+
+    index = build()
+
+    if meta is not None and meta["hashes"] == hashes:
+        index_file = f"index-{kind}-{_digest(hashes)}.faiss"
+        tmp_path = os.path.join(directory, f"{index_file}.{os.getpid()}.tmp")
+        faiss.write_index(index, tmp_path)
+        os.replace(tmp_path, os.path.join(directory, index_file))
+
+        meta.setdefault("indexes", {})[kind] = index_file
+        _write_meta(directory, meta)
+
+    return index
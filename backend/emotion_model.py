@@ -1,10 +1,52 @@
-from transformers import pipeline
+import os
+from batcher import MicroBatcher
+from lazy import Lazy, notify_first_load
 
-classifier = pipeline(
-    "text-classification",
-    model="j-hartmann/emotion-english-distilroberta-base"
+MODEL_NAME = "j-hartmann/emotion-english-distilroberta-base"
+
+# "torch" (full precision transformers pipeline) or "onnx" (int8 ONNX Runtime)
+EMOTION_BACKEND = os.getenv("EMOTION_BACKEND", "torch").lower()
+
+BATCH_MAX_SIZE = int(os.getenv("EMOTION_BATCH_MAX_SIZE", "16"))
+BATCH_MAX_WAIT_MS = float(os.getenv("EMOTION_BATCH_MAX_WAIT_MS", "5"))
+# Texts are grouped into buckets of this many characters so short messages
+# are not padded up to the longest one in the batch.
+BATCH_BUCKET_CHARS = int(os.getenv("EMOTION_BATCH_BUCKET_CHARS", "128"))
+
+
+def load_classifier(backend=EMOTION_BACKEND):
+    if backend == "onnx":
+        from onnx_emotion import load_onnx_classifier
+        return load_onnx_classifier(MODEL_NAME)
+    if backend == "torch":
+        from transformers import pipeline
+        return pipeline("text-classification", model=MODEL_NAME)
+    raise ValueError(f"Unknown EMOTION_BACKEND: {backend}")
+
+
+classifier = Lazy("emotion_classifier", load_classifier)
+
+
+def _classify_batch(texts):
+    results = classifier.get()(texts, batch_size=len(texts), truncation=True)
+    return [result["label"] for result in results]
+
+
+batcher = MicroBatcher(
+    _classify_batch,
+    max_batch_size=BATCH_MAX_SIZE,
+    max_wait_ms=BATCH_MAX_WAIT_MS,
+    bucket_key=lambda text: len(text) // BATCH_BUCKET_CHARS
 )
 
+
 def detect_emotion(text):
-    result = classifier(text)[0]
-    return result["label"]
+    if not classifier.loaded:
+        # The model is built on the batcher's thread, where the calling
+        # pipeline stage cannot see it; this call waits for the load
+        notify_first_load(classifier.name)
+    return batcher.submit(text)
+
+
+def batching_stats():
+    return batcher.stats()
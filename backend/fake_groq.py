@@ -0,0 +1,212 @@
+# Local stand-in for the Groq chat completions API, for offline testing of
+# llm_client (pooling, timeouts, retries, circuit breaker) and streaming.
+#
+#   python fake_groq.py --port 8089 --latency 0.3 --error-rate 0.2
+#   GROQ_BASE_URL=http://127.0.0.1:8089 GROQ_API_KEY=fake gunicorn app:app
+#
+# GET /stats returns request/connection counts; POST /config changes the
+# behaviour at runtime with the same keys as FakeGroqConfig.
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_REPLY = "I'm a local stand-in for the language model. It sounds like you're going through a lot, and I'm here to listen. 💜"
+
+
+class FakeGroqConfig:
+    __slots__ = ("latency", "token_delay", "error_rate", "error_status", "retry_after", "fail_next", "reply")
+
+    def __init__(self, latency=0.2, token_delay=0.02, error_rate=0.0, error_status=503,
+                 retry_after=None, fail_next=0, reply=DEFAULT_REPLY):
+        self.latency = latency            # seconds before the response / first token
+        self.token_delay = token_delay    # seconds between streamed tokens
+        self.error_rate = error_rate      # probability of answering with error_status
+        self.error_status = error_status  # e.g. 429, 500, 503
+        self.retry_after = retry_after    # Retry-After header value on errors
+        self.fail_next = fail_next        # fail exactly this many upcoming requests
+        self.reply = reply
+
+    def update(self, values):
+        for key, value in values.items():
+            if key in self.__slots__:
+                setattr(self, key, value)
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__}
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, so client pooling is visible
+
+    def setup(self):
+        super().setup()
+        self.server.count("connections")
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _read_json(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def do_GET(self):
+        if self.path.rstrip("/") == "/stats":
+            self._send_json(200, self.server.snapshot())
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if self.path.rstrip("/") == "/config":
+            self.server.config.update(self._read_json())
+            self._send_json(200, self.server.config.as_dict())
+            return
+
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+
+        request = self._read_json()
+        config = self.server.config
+        self.server.count("requests")
+
+        time.sleep(config.latency)
+
+        if self.server.should_fail():
+            self.server.count("errors")
+            headers = {}
+            if config.retry_after is not None:
+                headers["Retry-After"] = str(config.retry_after)
+            self._send_json(
+                config.error_status,
+                {"error": {"message": "fake upstream error", "type": "server_error"}},
+                headers
+            )
+            return
+
+        model = request.get("model", "fake-model")
+        if request.get("stream"):
+            self._stream(model, config)
+        else:
+            self._send_json(200, {
+                "id": f"chatcmpl-{uuid.uuid4().hex}",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": config.reply},
+                    "finish_reason": "stop"
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0}
+            })
+
+    def _stream(self, model, config):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+
+        def send(data):
+            payload = f"data: {data}\n\n".encode("utf-8")
+            self.wfile.write(f"{len(payload):X}\r\n".encode("ascii") + payload + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None):
+            return json.dumps({
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+            })
+
+        try:
+            send(chunk({"role": "assistant", "content": ""}))
+            for i, word in enumerate(config.reply.split(" ")):
+                if i:
+                    time.sleep(config.token_delay)
+                send(chunk({"content": word if i == 0 else " " + word}))
+            send(chunk({}, "stop"))
+            send("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            self.close_connection = True  # client closed the stream early
+
+
+class FakeGroqServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address, config):
+        super().__init__(address, _Handler)
+        self.config = config
+        self._lock = threading.Lock()
+        self.counters = {"connections": 0, "requests": 0, "errors": 0}
+
+    def count(self, key):
+        with self._lock:
+            self.counters[key] += 1
+
+    def should_fail(self):
+        with self._lock:
+            if self.config.fail_next > 0:
+                self.config.fail_next -= 1
+                return True
+        return random.random() < self.config.error_rate
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.counters, config=self.config.as_dict())
+
+    @property
+    def base_url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+def start_fake_server(host="127.0.0.1", port=0, **config):
+    # Starts the server on a background thread; port=0 picks a free port.
+    server = FakeGroqServer((host, port), FakeGroqConfig(**config))
+    thread = threading.Thread(target=server.serve_forever, name="fake-groq", daemon=True)
+    thread.start()
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake Groq chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8089)
+    parser.add_argument("--latency", type=float, default=0.2)
+    parser.add_argument("--token-delay", type=float, default=0.02)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--error-status", type=int, default=503)
+    parser.add_argument("--retry-after", type=float, default=None)
+    args = parser.parse_args()
+
+    server = FakeGroqServer((args.host, args.port), FakeGroqConfig(
+        latency=args.latency,
+        token_delay=args.token_delay,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        retry_after=args.retry_after
+    ))
+    print(f"Fake Groq listening on {server.base_url}", flush=True)
+    server.serve_forever()
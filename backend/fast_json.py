@@ -0,0 +1,22 @@
+import json
+from datetime import date, datetime
+
+# orjson is several times faster than json.dumps for large lists of rows and
+# serializes datetimes natively; fall back to the standard library without it.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(value):
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+
+def dumps(payload):
+    # Returns UTF-8 encoded bytes
+    if orjson is not None:
+        return orjson.dumps(payload, option=orjson.OPT_NAIVE_UTC)
+    return json.dumps(payload, default=_default, separators=(",", ":")).encode("utf-8")
@@ -1,43 +1,171 @@
-from groq import Groq
-import os
+import threading
+import time
 from dotenv import load_dotenv
 from rag_engine import retrieve_context
+import llm_client
+from prompt_builder import select_turns, build_chat_messages, count_message_tokens
 
 load_dotenv()
 
-client = Groq(api_key=os.getenv("GROQ_API_KEY"))
+MODEL = "llama-3.3-70b-versatile"
 
-def generate_ai_response(user_input, emotion, history):
+SYSTEM_PROMPT = "You are a compassionate mental health support assistant. Be empathetic, supportive, and encouraging. Never provide medical diagnoses."
 
-    context = retrieve_context(user_input)
+FALLBACK_REPLY = "I'm here for you. It sounds like you're going through a difficult time. Please know that your feelings are valid. Consider reaching out to a counselor or trusted friend. You're not alone. 💜"
 
-    prompt = f"""You are a compassionate mental health assistant.
+LLM_PARAMS = {"model": MODEL, "temperature": 0.7, "max_tokens": 500}
 
-Detected emotion: {emotion}
+_fallback_lock = threading.Lock()
+fallback_count = 0
 
-Relevant knowledge:
-{context}
 
-Conversation history:
-{history}
+def _fallback(error):
+    global fallback_count
+    with _fallback_lock:
+        fallback_count += 1
+    print(f"Groq API Error: {error}")
+    return FALLBACK_REPLY
+
+
+def build_messages(user_input, emotion, history, features=None, context=None):
+    # history: conversation_store.History. Recent turns go in verbatim as
+    # user/assistant messages, earlier ones through the rolling summary.
+
+    if context is None:
+        context = retrieve_context(user_input, features)
+
+    knowledge = "\n".join(context) if isinstance(context, (list, tuple)) else context
 
-User message:
-{user_input}
+    system = f"""{SYSTEM_PROMPT}
+
+Detected emotion: {emotion}
+
+Relevant knowledge:
+{knowledge}
 
 Respond empathetically. Do not give medical diagnosis.
 Encourage professional help if needed."""
 
+    recent = select_turns(history.turns)
+    messages = build_chat_messages(system, user_input, recent, history.summary)
+
+    print(
+        f"Prompt: {count_message_tokens(messages)} tokens, "
+        f"{len(recent)}/{len(history)} turns verbatim, summary up to turn {history.summarized}",
+        flush=True
+    )
+    return messages
+
+
+def generate_ai_response(user_input, emotion, history, features=None, context=None):
+
+    messages = build_messages(user_input, emotion, history, features, context)
+
+    try:
+        return llm_client.complete(messages, **LLM_PARAMS)
+    except Exception as e:
+        return _fallback(e)
+
+
+# =========================
+# STREAMING
+# =========================
+
+class _LatencyStats:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+
+    def record(self, seconds):
+        with self._lock:
+            self.count += 1
+            self.total += seconds
+            self.max = max(self.max, seconds)
+            self.last = seconds
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "count": self.count,
+                "avg_ms": self.total / self.count * 1000.0 if self.count else 0.0,
+                "max_ms": self.max * 1000.0,
+                "last_ms": self.last * 1000.0
+            }
+
+
+ttft_stats = _LatencyStats()
+stream_total_stats = _LatencyStats()
+
+
+def stream_ai_response(user_input, emotion, history, features=None, started=None, context=None):
+    # Yields reply text deltas as Groq produces them. If the upstream fails
+    # before anything was sent the fallback reply is yielded instead.
+    started = started or time.perf_counter()
+    messages = build_messages(user_input, emotion, history, features, context)
+    first = True
+
+    try:
+        for delta in llm_client.stream(messages, **LLM_PARAMS):
+            if first:
+                ttft_stats.record(time.perf_counter() - started)
+                first = False
+            yield delta
+    except Exception as e:
+        if first:
+            _fallback(e)
+        else:
+            print(f"Groq API Error: {e}")
+
+    if first:
+        ttft_stats.record(time.perf_counter() - started)
+        yield FALLBACK_REPLY
+
+    stream_total_stats.record(time.perf_counter() - started)
+
+
+# =========================
+# ASYNC (ASGI MODE)
+# =========================
+
+async def agenerate_ai_response(messages):
     try:
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": "You are a compassionate mental health support assistant. Be empathetic, supportive, and encouraging. Never provide medical diagnoses."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.7,
-            max_tokens=500
-        )
-        return response.choices[0].message.content
+        return await llm_client.acomplete(messages, **LLM_PARAMS)
     except Exception as e:
-        print(f"Groq API Error: {e}")
-        return f"I'm here for you. It sounds like you're going through a difficult time. Please know that your feelings are valid. Consider reaching out to a counselor or trusted friend. You're not alone. 💜"
+        return _fallback(e)
+
+
+async def astream_ai_response(messages, started=None):
+    started = started or time.perf_counter()
+    first = True
+
+    try:
+        async for delta in llm_client.astream(messages, **LLM_PARAMS):
+            if first:
+                ttft_stats.record(time.perf_counter() - started)
+                first = False
+            yield delta
+    except Exception as e:
+        if first:
+            _fallback(e)
+        else:
+            print(f"Groq API Error: {e}")
+
+    if first:
+        ttft_stats.record(time.perf_counter() - started)
+        yield FALLBACK_REPLY
+
+    stream_total_stats.record(time.perf_counter() - started)
+
+
+def latency_stats():
+    return {
+        "time_to_first_token": ttft_stats.snapshot(),
+        "stream_total": stream_total_stats.snapshot(),
+        "fallbacks": fallback_count,
+        "client": llm_client.stats(),
+        "summary_client": llm_client.stats(llm_client.summaries)
+    }
@@ -0,0 +1,85 @@
+import os
+from sqlalchemy import func, select
+from models import Conversation
+
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+
+_COLUMNS = (
+    Conversation.id,
+    Conversation.message,
+    Conversation.response,
+    Conversation.emotion,
+    Conversation.created_at
+)
+
+
+def _optional_int(value):
+    return int(value) if value not in (None, "") else None
+
+
+def page_args(data):
+    # (before_id, since_id, limit) from the /history body or query string;
+    # raises ValueError
+    before_id = _optional_int(data.get("before_id"))
+    since_id = _optional_int(data.get("since_id"))
+
+    limit = int(data.get("limit") or HISTORY_PAGE_SIZE)
+    if limit < 1:
+        raise ValueError("limit must be positive")
+
+    return before_id, since_id, min(limit, HISTORY_MAX_PAGE_SIZE)
+
+
+def page_statement(user_id, before_id, limit, since_id=None):
+    # Newest first. Served from ix_conversation_user_id_id, so the cost
+    # depends on the page size, not on how many rows the user has. One
+    # extra row is fetched to tell whether another page exists.
+    # since_id restricts the page to rows newer than the client already has.
+    statement = select(*_COLUMNS).where(Conversation.user_id == user_id)
+    if before_id is not None:
+        statement = statement.where(Conversation.id < before_id)
+    if since_id is not None:
+        statement = statement.where(Conversation.id > since_id)
+    return statement.order_by(Conversation.id.desc()).limit(limit + 1)
+
+
+def latest_id_statement(user_id):
+    # One index probe; rows are append-only, so the newest id identifies
+    # the state of a user's history
+    return select(func.max(Conversation.id)).where(Conversation.user_id == user_id)
+
+
+def etag(user_id, latest_id, before_id, since_id, limit):
+    return f"h{user_id}-{latest_id or 0}-{before_id or ''}-{since_id or ''}-{limit}"
+
+
+def _items(rows):
+    return [
+        {
+            "id": row.id,
+            "message": row.message,
+            "response": row.response,
+            "emotion": row.emotion,
+            "created_at": row.created_at
+        }
+        for row in rows
+    ]
+
+
+def page_payload(rows, limit):
+    # GET /history: a page, newest first, plus the cursor for the next one
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    return {
+        "items": _items(rows),
+        "has_more": has_more,
+        "next_before_id": rows[-1].id if has_more else None
+    }
+
+
+def legacy_payload(rows, limit):
+    # POST /history keeps its original shape, a plain list oldest first;
+    # it holds the newest page (older pages via before_id)
+    return _items(reversed(rows[:limit]))
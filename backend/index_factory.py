@@ -0,0 +1,266 @@
+import argparse
+import json
+import math
+import os
+import time
+import numpy as np
+
+# flat | ivf_flat | ivf_pq | hnsw
+INDEX_TYPE = os.getenv("RAG_INDEX_TYPE", "flat").lower()
+
+IVF_NLIST = int(os.getenv("RAG_IVF_NLIST", "0"))  # 0 = derive from corpus size
+IVF_NPROBE = int(os.getenv("RAG_IVF_NPROBE", "8"))
+PQ_M = int(os.getenv("RAG_PQ_M", "16"))  # sub-quantizers, must divide the dimension
+PQ_NBITS = int(os.getenv("RAG_PQ_NBITS", "8"))
+HNSW_M = int(os.getenv("RAG_HNSW_M", "32"))
+HNSW_EF_CONSTRUCTION = int(os.getenv("RAG_HNSW_EF_CONSTRUCTION", "200"))
+HNSW_EF_SEARCH = int(os.getenv("RAG_HNSW_EF_SEARCH", "64"))
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw")
+
+# faiss warns below ~39 training points per centroid
+MIN_POINTS_PER_CENTROID = 39
+
+
+def _nlist(count):
+    if IVF_NLIST > 0:
+        return min(IVF_NLIST, count)
+    return max(1, min(int(4 * math.sqrt(count)), count // MIN_POINTS_PER_CENTROID))
+
+
+def resolve_kind(kind, count):
+    if kind not in INDEX_TYPES:
+        raise ValueError(f"Unknown RAG_INDEX_TYPE: {kind}")
+
+    # PQ codebooks need 2**nbits training points; tiny corpora use flat
+    if kind == "ivf_pq" and count < 2 ** PQ_NBITS:
+        print(f"{count} passages is too few to train ivf_pq, using flat", flush=True)
+        return "flat"
+    return kind
+
+
+def cache_key(kind, count):
+    if kind in ("ivf_flat", "ivf_pq"):
+        key = f"{kind}-nlist{_nlist(count)}"
+        if kind == "ivf_pq":
+            key += f"-m{PQ_M}x{PQ_NBITS}"
+        return key
+    if kind == "hnsw":
+        return f"hnsw-m{HNSW_M}-ef{HNSW_EF_CONSTRUCTION}"
+    return "idmap-flat"
+
+
+def supports_remove(kind):
+    # HNSW graphs cannot delete nodes; reloads rebuild them instead
+    return kind != "hnsw"
+
+
+def patched_index(index, kind, removed_ids, vectors, new_ids):
+    """Copy of ``index`` with ``removed_ids`` dropped and ``vectors`` added,
+    or None when it cannot be patched and must be rebuilt: HNSW, or an IVF
+    index loaded from the cache with IO_FLAG_MMAP, whose on-disk inverted
+    lists faiss can neither clone nor modify."""
+    import faiss
+
+    if not supports_remove(kind):
+        return None
+    try:
+        index = faiss.clone_index(index)
+    except RuntimeError:
+        return None
+
+    if len(removed_ids):
+        index.remove_ids(np.asarray(removed_ids, dtype=np.int64))
+    if len(new_ids):
+        index.add_with_ids(np.ascontiguousarray(vectors, dtype=np.float32), new_ids)
+    return configure_search(index, kind)
+
+
+def build_index(embeddings, ids, kind):
+    import faiss
+
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    ids = np.asarray(ids, dtype=np.int64)
+    count, dimension = embeddings.shape
+
+    if kind == "flat":
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(dimension))
+    elif kind == "hnsw":
+        hnsw = faiss.IndexHNSWFlat(dimension, HNSW_M)
+        hnsw.hnsw.efConstruction = HNSW_EF_CONSTRUCTION
+        index = faiss.IndexIDMap2(hnsw)
+    else:
+        quantizer = faiss.IndexFlatL2(dimension)
+        if kind == "ivf_flat":
+            index = faiss.IndexIVFFlat(quantizer, dimension, _nlist(count))
+        else:
+            index = faiss.IndexIVFPQ(quantizer, dimension, _nlist(count), PQ_M, PQ_NBITS)
+        index.train(embeddings)
+
+    index.add_with_ids(embeddings, ids)
+    configure_search(index, kind)
+    return index
+
+
+def configure_search(index, kind, nprobe=None, ef_search=None):
+    import faiss
+
+    if kind in ("ivf_flat", "ivf_pq"):
+        ivf = faiss.extract_index_ivf(index)
+        ivf.nprobe = min(nprobe or IVF_NPROBE, ivf.nlist)
+    elif kind == "hnsw":
+        hnsw = faiss.downcast_index(index.index)
+        hnsw.hnsw.efSearch = ef_search or HNSW_EF_SEARCH
+    return index
+
+
+# =========================
+# RECALL / LATENCY REPORT
+# =========================
+
+def _search_ms(index, queries, k):
+    started = time.perf_counter()
+    _, found = index.search(queries, k)
+    return found, (time.perf_counter() - started) * 1000.0 / len(queries)
+
+
+def _recall(found, truth):
+    hits = sum(len(set(f) & set(t)) for f, t in zip(found.tolist(), truth.tolist()))
+    return hits / truth.size
+
+
+def recall_report(embeddings, queries, k=5, nprobes=(1, 4, 8, 16, 32), ef_searches=(16, 32, 64, 128)):
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    ids = np.arange(len(embeddings), dtype=np.int64)
+    k = min(k, len(embeddings))
+
+    flat = build_index(embeddings, ids, "flat")
+    truth, flat_ms = _search_ms(flat, queries, k)
+
+    report = {
+        "passages": len(embeddings),
+        "queries": len(queries),
+        "k": k,
+        "modes": [{"mode": "flat", "recall": 1.0, "ms_per_query": round(flat_ms, 4)}]
+    }
+
+    for kind in ("ivf_flat", "ivf_pq", "hnsw"):
+        if resolve_kind(kind, len(embeddings)) != kind:
+            continue
+
+        started = time.perf_counter()
+        index = build_index(embeddings, ids, kind)
+        build_seconds = time.perf_counter() - started
+
+        if kind == "hnsw":
+            settings = [("efSearch", ef, {"ef_search": ef}) for ef in ef_searches]
+        else:
+            settings = [("nprobe", n, {"nprobe": n}) for n in nprobes]
+
+        for name, value, params in settings:
+            configure_search(index, kind, **params)
+            found, ms = _search_ms(index, queries, k)
+            report["modes"].append({
+                "mode": kind,
+                name: value,
+                "recall": round(_recall(found, truth), 4),
+                "ms_per_query": round(ms, 4),
+                "build_seconds": round(build_seconds, 3)
+            })
+
+    return report
+
+
+# =========================
+# RESTART + RELOAD CHECK
+# =========================
+
+def reload_check(embeddings, kinds=INDEX_TYPES, held_out=10, dropped=5):
+    """Builds each index kind through the embedding cache, loads it back the
+    way a restarted process does (memory-mapped), then applies a knowledge
+    reload to it: ``dropped`` passages removed, ``held_out`` added."""
+    import tempfile
+    from embedding_cache import cached_index, encode_with_cache
+
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    count = len(embeddings) - held_out
+    lines = [f"passage {i}" for i in range(len(embeddings))]
+    row = {line: i for i, line in enumerate(lines)}
+
+    def encode(batch):
+        return embeddings[[row[line] for line in batch]]
+
+    results = []
+    for requested in kinds:
+        kind = resolve_kind(requested, count)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            vectors = encode_with_cache("reload-check", encode, lines[:count], cache_dir=cache_dir)
+
+            def build():
+                return build_index(vectors, np.arange(count), kind)
+
+            key = cache_key(kind, count)
+            cached_index("reload-check", lines[:count], build, kind=key, cache_dir=cache_dir)
+            # "Restart": the second call loads the saved file instead of building
+            loaded = cached_index("reload-check", lines[:count], build, kind=key, cache_dir=cache_dir)
+            configure_search(loaded, kind)
+
+            removed = np.arange(dropped, dtype=np.int64)
+            new_ids = np.arange(count, len(embeddings), dtype=np.int64)
+            index = patched_index(loaded, kind, removed, embeddings[count:], new_ids)
+            patched = index is not None
+            if index is None:
+                keep = np.arange(dropped, len(embeddings))
+                index = build_index(embeddings[keep], keep, kind)
+
+            # Probe every list so a miss means the passage is not in the index
+            configure_search(index, kind, nprobe=len(embeddings))
+            k = min(5, index.ntotal)
+            _, found = index.search(embeddings[count:], k)
+            _, everything = index.search(embeddings, k)
+
+            added_found = all(i in f for i, f in zip(new_ids.tolist(), found.tolist()))
+            removed_gone = not set(removed.tolist()) & set(everything.ravel().tolist())
+            results.append({
+                "requested": requested,
+                "kind": kind,
+                "patched": patched,
+                "ntotal": int(index.ntotal),
+                "ok": added_found and removed_gone and index.ntotal == len(embeddings) - dropped
+            })
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compare ANN index modes against the flat index")
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--check-reload", action="store_true",
+                        help="check that every index type survives a restart followed by a reload")
+    parser.add_argument("--queries", help="file with one query per line (default: sample of the corpus)")
+    parser.add_argument("--sample", type=int, default=200, help="corpus lines used as queries")
+    args = parser.parse_args()
+
+    import rag_engine
+    from embedding_cache import encode_with_cache
+
+    knowledge = rag_engine._read_knowledge()
+    embeddings = encode_with_cache(
+        rag_engine.EMBEDDING_MODEL_NAME, rag_engine._encode, knowledge, corpus=rag_engine.CACHE_CORPUS
+    )
+
+    if args.check_reload:
+        results = reload_check(embeddings)
+        print(json.dumps(results, indent=2))
+        raise SystemExit(0 if all(r["ok"] for r in results) else 1)
+
+    if args.queries:
+        with open(args.queries, "r", encoding="utf-8") as f:
+            lines = [line.strip() for line in f if line.strip()]
+        queries = np.asarray(rag_engine._encode(lines), dtype=np.float32)
+    else:
+        rng = np.random.default_rng(0)
+        picked = rng.choice(len(embeddings), size=min(args.sample, len(embeddings)), replace=False)
+        queries = np.asarray(embeddings[np.sort(picked)])
+
+    print(json.dumps(recall_report(embeddings, queries, k=args.k), indent=2))
@@ -0,0 +1,96 @@
+import threading
+import time
+from contextlib import contextmanager
+
+# component name -> seconds spent building it
+load_times = {}
+
+_registry = []
+
+_local = threading.local()
+
+
+class Lazy:
+    """Thread-safe, build-once holder for an expensive resource."""
+
+    def __init__(self, name, factory):
+        self.name = name
+        self.factory = factory
+        self._value = None
+        self._loaded = False
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    @property
+    def loaded(self):
+        return self._loaded
+
+    def get(self):
+        if self._loaded:
+            return self._value
+
+        notify_first_load(self.name)
+
+        with self._lock:
+            if not self._loaded:
+                started = time.perf_counter()
+                self._value = self.factory()
+                elapsed = time.perf_counter() - started
+                load_times[self.name] = elapsed
+                self._loaded = True
+                print(f"Loaded {self.name} in {elapsed:.2f}s", flush=True)
+
+        return self._value
+
+
+@contextmanager
+def on_first_load(callback):
+    # callback(name) runs whenever this thread has to build a resource, or
+    # wait for another thread building it, inside the with block
+    previous = getattr(_local, "on_load", None)
+    _local.on_load = callback
+    try:
+        yield
+    finally:
+        _local.on_load = previous
+
+
+def notify_first_load(name):
+    # For resources built on another thread (e.g. the emotion model, loaded
+    # by the micro-batcher's worker): tells this thread's on_first_load
+    # callback that it is waiting on a load
+    on_load = getattr(_local, "on_load", None)
+    if on_load is not None:
+        on_load(name)
+
+
+def record_time(name, started):
+    load_times[name] = time.perf_counter() - started
+
+
+def warm_up(background=True):
+    def run():
+        for resource in list(_registry):
+            try:
+                resource.get()
+            except Exception as e:
+                print(f"Warm-up of {resource.name} failed: {e}", flush=True)
+
+    if not background:
+        run()
+        return None
+
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+def status():
+    return {
+        "components": {
+            resource.name: resource.loaded for resource in _registry
+        },
+        "load_times": {
+            name: round(seconds, 4) for name, seconds in load_times.items()
+        }
+    }
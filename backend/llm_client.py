@@ -0,0 +1,369 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from lazy import Lazy
+
+# Point at the bundled fake server (python fake_groq.py) to work offline
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+READ_TIMEOUT = float(os.getenv("LLM_READ_TIMEOUT", "30"))
+POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "20"))
+KEEPALIVE_CONNECTIONS = int(os.getenv("LLM_KEEPALIVE_CONNECTIONS", "20"))
+KEEPALIVE_EXPIRY = float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+
+# Consecutive failed calls that open the breaker, and how long it stays open
+BREAKER_FAILURES = int(os.getenv("LLM_BREAKER_FAILURES", "5"))
+BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))
+
+
+class CircuitOpen(Exception):
+    pass
+
+
+class CircuitBreaker:
+    # closed -> open after `failures` consecutive errors; after `reset`
+    # seconds one trial call is let through (half-open) and its outcome
+    # closes or re-opens the breaker. A trial that never reports back is
+    # replaced by a new one after another `reset` seconds.
+
+    def __init__(self, failures=BREAKER_FAILURES, reset=BREAKER_RESET):
+        self.failure_threshold = failures
+        self.reset = reset
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_started = 0.0
+        self.times_opened = 0
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            now = time.monotonic()
+            if self.state == "open" and now - self.opened_at >= self.reset:
+                self.state = "half_open"
+                self.trial_started = now
+                return True
+            if self.state == "half_open" and now - self.trial_started >= self.reset:
+                self.trial_started = now
+                return True
+            return False
+
+    def release(self):
+        # The call ended without saying anything about upstream health
+        # (abandoned, or rejected as a bad request): let the next call be
+        # the trial instead
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self.opened_at = time.monotonic() - self.reset
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.times_opened += 1
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+class Channel:
+    # One kind of traffic with its own breaker and counters, so background
+    # summaries failing on their model never open the breaker for chat
+    # replies or show up in the chat failure counts
+
+    def __init__(self, name, breaker):
+        self.name = name
+        self.breaker = breaker
+        self._lock = threading.Lock()
+        self.counters = {
+            "calls": 0, "attempts": 0, "retries": 0, "failures": 0, "client_errors": 0, "short_circuited": 0
+        }
+
+    def count(self, key, amount=1):
+        with self._lock:
+            self.counters[key] += amount
+
+    def stats(self):
+        with self._lock:
+            counters = dict(self.counters)
+        counters["breaker"] = {
+            "state": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "times_opened": self.breaker.times_opened
+        }
+        return counters
+
+
+chat = Channel("chat", CircuitBreaker())
+summaries = Channel("summary", CircuitBreaker())
+
+breaker = chat.breaker
+
+
+# =========================
+# CLIENTS
+# =========================
+
+def _timeout():
+    import httpx
+    return httpx.Timeout(READ_TIMEOUT, connect=CONNECT_TIMEOUT)
+
+
+def _limits():
+    import httpx
+    return httpx.Limits(
+        max_connections=POOL_SIZE,
+        max_keepalive_connections=KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+
+def _create_client():
+    import httpx
+    from groq import Groq
+    # Retries are handled here so the breaker sees every failure
+    return Groq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        base_url=GROQ_BASE_URL,
+        max_retries=0,
+        timeout=_timeout(),
+        http_client=httpx.Client(timeout=_timeout(), limits=_limits())
+    )
+
+
+def _create_async_client():
+    import httpx
+    from groq import AsyncGroq
+    return AsyncGroq(
+        api_key=os.getenv("GROQ_API_KEY"),
+        base_url=GROQ_BASE_URL,
+        max_retries=0,
+        timeout=_timeout(),
+        http_client=httpx.AsyncClient(timeout=_timeout(), limits=_limits())
+    )
+
+
+client = Lazy("groq_client", _create_client)
+async_client = Lazy("groq_async_client", _create_async_client)
+
+
+# =========================
+# RETRY POLICY
+# =========================
+
+def _retryable(error):
+    import groq
+    if isinstance(error, (groq.APIConnectionError, groq.RateLimitError, groq.InternalServerError)):
+        return True
+    status = getattr(error, "status_code", None)
+    return status is not None and status >= 500
+
+
+def _retry_after(error):
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    value = response.headers.get("retry-after")
+    try:
+        return max(0.0, float(value)) if value is not None else None
+    except ValueError:
+        return None
+
+
+def backoff_delay(attempt, error=None):
+    retry_after = _retry_after(error) if error is not None else None
+    if retry_after is not None:
+        return min(retry_after, BACKOFF_MAX)
+    # "Full jitter" exponential backoff
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * (2 ** attempt)))
+
+
+def _before_call(channel):
+    channel.count("calls")
+    if not channel.breaker.allow():
+        channel.count("short_circuited")
+        raise CircuitOpen(f"LLM upstream marked unhealthy for {channel.name}")
+
+
+def _give_up(channel, error, attempt):
+    # True when the error should be raised instead of retried. Only
+    # upstream trouble (429, 5xx, connection errors) counts against the
+    # breaker; any other 4xx is this request's fault.
+    if not _retryable(error):
+        channel.count("client_errors")
+        channel.breaker.release()
+        return True
+    if attempt >= MAX_RETRIES:
+        channel.count("failures")
+        channel.breaker.record_failure()
+        return True
+    channel.count("retries")
+    return False
+
+
+def _stream_broken(channel, error):
+    # A stream failed after deltas were sent; it cannot be retried
+    if _retryable(error):
+        channel.count("failures")
+        channel.breaker.record_failure()
+    else:
+        channel.count("client_errors")
+        channel.breaker.release()
+
+
+def _abandoned(channel, sent):
+    # The caller stopped consuming (client disconnect, cancellation)
+    if sent:
+        channel.breaker.record_success()
+    else:
+        channel.breaker.release()
+
+
+# =========================
+# SYNC API
+# =========================
+
+def complete(messages, channel=chat, **params):
+    _before_call(channel)
+
+    attempt = 0
+    while True:
+        channel.count("attempts")
+        settled = False
+        try:
+            response = client.get().chat.completions.create(messages=messages, **params)
+            settled = True
+            channel.breaker.record_success()
+            return response.choices[0].message.content
+        except Exception as e:
+            settled = True
+            if _give_up(channel, e, attempt):
+                raise
+            delay = backoff_delay(attempt, e)
+        finally:
+            if not settled:
+                _abandoned(channel, False)
+        time.sleep(delay)
+        attempt += 1
+
+
+def stream(messages, channel=chat, **params):
+    # Yields content deltas. Retries only happen before the first delta has
+    # been yielded; a stream that breaks midway raises.
+    _before_call(channel)
+
+    attempt = 0
+    while True:
+        channel.count("attempts")
+        sent = settled = False
+        chunks = None
+        try:
+            chunks = client.get().chat.completions.create(messages=messages, stream=True, **params)
+            for chunk in chunks:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    sent = True
+                    yield delta
+            settled = True
+            channel.breaker.record_success()
+            return
+        except Exception as e:
+            settled = True
+            if sent:
+                _stream_broken(channel, e)
+                raise
+            if _give_up(channel, e, attempt):
+                raise
+            delay = backoff_delay(attempt, e)
+        finally:
+            # Also runs on GeneratorExit when the consumer goes away
+            if chunks is not None:
+                chunks.close()
+            if not settled:
+                _abandoned(channel, sent)
+        time.sleep(delay)
+        attempt += 1
+
+
+# =========================
+# ASYNC API
+# =========================
+
+async def acomplete(messages, channel=chat, **params):
+    _before_call(channel)
+
+    attempt = 0
+    while True:
+        channel.count("attempts")
+        settled = False
+        try:
+            response = await async_client.get().chat.completions.create(messages=messages, **params)
+            settled = True
+            channel.breaker.record_success()
+            return response.choices[0].message.content
+        except Exception as e:
+            settled = True
+            if _give_up(channel, e, attempt):
+                raise
+            delay = backoff_delay(attempt, e)
+        finally:
+            # CancelledError is not an Exception
+            if not settled:
+                _abandoned(channel, False)
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+async def astream(messages, channel=chat, **params):
+    _before_call(channel)
+
+    attempt = 0
+    while True:
+        channel.count("attempts")
+        sent = settled = False
+        chunks = None
+        try:
+            chunks = await async_client.get().chat.completions.create(messages=messages, stream=True, **params)
+            async for chunk in chunks:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    sent = True
+                    yield delta
+            settled = True
+            channel.breaker.record_success()
+            return
+        except Exception as e:
+            settled = True
+            if sent:
+                _stream_broken(channel, e)
+                raise
+            if _give_up(channel, e, attempt):
+                raise
+            delay = backoff_delay(attempt, e)
+        finally:
+            # Also runs on aclose() and CancelledError
+            if not settled:
+                _abandoned(channel, sent)
+            if chunks is not None:
+                await chunks.close()
+        await asyncio.sleep(delay)
+        attempt += 1
+
+
+def stats(channel=chat):
+    return channel.stats()
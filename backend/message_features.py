@@ -0,0 +1,25 @@
+import rag_engine
+
+
+class MessageFeatures:
+    # Computed once per message and shared by every stage that needs it, so
+    # the MiniLM encoder runs at most once per request.
+    __slots__ = ("text", "normalized", "_embedding", "_tokens")
+
+    def __init__(self, text):
+        self.text = text
+        self.normalized = rag_engine.normalize_query(text)
+        self._embedding = None
+        self._tokens = None
+
+    @property
+    def embedding(self):
+        if self._embedding is None:
+            self._embedding = rag_engine.embed_query(self.normalized)
+        return self._embedding
+
+    @property
+    def tokens(self):
+        if self._tokens is None:
+            self._tokens = rag_engine.model.get().tokenizer.tokenize(self.normalized)
+        return self._tokens
@@ -0,0 +1,280 @@
+import bisect
+import math
+import threading
+import time
+
+# Counters and histograms rendered in the Prometheus text format by
+# /metrics. Request-path cost is one lock and a bisect per observation;
+# everything that already has a stats() (caches, stores, queues, the LLM
+# client) is read at scrape time by a collector instead of being counted
+# twice.
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Seconds; covers lexicon hits (~0.1 ms) through slow LLM replies
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_INF = 'le="+Inf"'
+
+_metrics = []
+_collectors = []
+
+
+def _format_value(value):
+    if value is True or value is False:
+        value = int(value)
+    if isinstance(value, float):
+        if math.isinf(value):
+            return "+Inf" if value > 0 else "-Inf"
+        if math.isnan(value):
+            return "NaN"
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=""):
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children = {}
+        self._lock = threading.Lock()
+        _metrics.append(self)
+
+    def labels(self, *values):
+        # Children are cached, so hot paths can bind them once at import
+        values = tuple(str(v) for v in values)
+        child = self._children.get(values)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(values, self._child())
+        return child
+
+    def _child(self):
+        raise NotImplementedError
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        with self._lock:
+            children = list(self._children.items())
+        for values, child in children:
+            lines.extend(child.render(self.name, self.labelnames, values))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("_lock", "value")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.value = 0
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+    def render(self, name, labelnames, values):
+        return [f"{name}{_format_labels(labelnames, values)} {_format_value(self.value)}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _child(self):
+        return _CounterChild()
+
+    def inc(self, amount=1):
+        self.labels().inc(amount)
+
+
+class _HistogramChild:
+    __slots__ = ("_lock", "_upper", "_counts", "sum", "count")
+
+    def __init__(self, upper):
+        self._lock = threading.Lock()
+        self._upper = upper
+        self._counts = [0] * (len(upper) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        i = bisect.bisect_left(self._upper, seconds)
+        with self._lock:
+            self._counts[i] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def render(self, name, labelnames, values):
+        with self._lock:
+            counts, total, count = list(self._counts), self.sum, self.count
+
+        lines = []
+        cumulative = 0
+        for upper, n in zip(self._upper, counts):
+            cumulative += n
+            le = f'le="{_format_value(float(upper))}"'
+            lines.append(f"{name}_bucket{_format_labels(labelnames, values, le)} {cumulative}")
+        lines.append(f"{name}_bucket{_format_labels(labelnames, values, _INF)} {count}")
+        lines.append(f"{name}_sum{_format_labels(labelnames, values)} {_format_value(total)}")
+        lines.append(f"{name}_count{_format_labels(labelnames, values)} {count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("_child", "_started")
+
+    def __init__(self, child):
+        self._child = child
+
+    def __enter__(self):
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self._child.observe(time.perf_counter() - self._started)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(float(b) for b in buckets))
+        super().__init__(name, help, labelnames)
+
+    def _child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, seconds):
+        self.labels().observe(seconds)
+
+
+def register_collector(func):
+    """``func()`` returns an iterable of ``(name, kind, help, labels, value)``
+    read at scrape time; samples sharing a name are grouped under one
+    HELP/TYPE header. Returns ``func`` so it can be used as a decorator."""
+    _collectors.append(func)
+    return func
+
+
+def _render_collected(lines):
+    families = {}
+    for collect in _collectors:
+        try:
+            samples = list(collect())
+        except Exception as e:
+            print(f"Metrics collector {getattr(collect, '__name__', collect)} failed: {e}", flush=True)
+            continue
+        for name, kind, help, labels, value in samples:
+            if value is None:
+                continue
+            family = families.setdefault(name, (kind, help, []))
+            family[2].append((labels or {}, value))
+
+    for name, (kind, help, samples) in families.items():
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for labels, value in samples:
+            lines.append(f"{name}{_format_labels(labels.keys(), labels.values())} {_format_value(value)}")
+
+
+def render():
+    lines = []
+    for metric in list(_metrics):
+        lines.extend(metric.render())
+    _render_collected(lines)
+    return "\n".join(lines) + "\n"
+
+
+# =========================
+# SHARED METRICS
+# =========================
+
+http_requests = Counter(
+    "mindcare_http_requests_total", "HTTP requests by endpoint and status",
+    ("method", "endpoint", "status")
+)
+http_request_seconds = Histogram(
+    "mindcare_http_request_duration_seconds",
+    "Time to the response headers (streams: before the first event)",
+    ("endpoint",)
+)
+stage_seconds = Histogram(
+    "mindcare_chat_stage_duration_seconds",
+    "Chat stage duration: crisis, emotion, retrieval, llm, persist",
+    ("stage",)
+)
+db_commit_seconds = Histogram(
+    "mindcare_db_commit_duration_seconds", "Conversation INSERT + COMMIT",
+    ("mode",)
+)
+
+
+def record_request(method, endpoint, status, seconds):
+    http_requests.labels(method, endpoint or "unmatched", status).inc()
+    http_request_seconds.labels(endpoint or "unmatched").observe(seconds)
+
+
+@register_collector
+def _runtime_samples():
+    # Imported here: these modules load models and clients lazily and
+    # chat_pipeline (which imports this module) is also used by the
+    # Streamlit app without them
+    import llm_client
+    import gemini_service
+    from conversation_store import conversations
+    from response_cache import response_cache
+    from rag_engine import cache_stats
+    from prompt_builder import summarizer
+    from admission import chat_admission
+
+    for channel in (llm_client.chat, llm_client.summaries):
+        llm = channel.stats()
+        labels = {"channel": channel.name}
+        for key in ("calls", "attempts", "retries", "failures", "client_errors", "short_circuited"):
+            yield ("mindcare_llm_" + key + "_total", "counter", "Groq client " + key.replace("_", " "),
+                   labels, llm[key])
+        for state in ("closed", "open", "half_open"):
+            yield ("mindcare_llm_circuit_state", "gauge", "1 for the circuit breaker's current state",
+                   dict(labels, state=state), int(llm["breaker"]["state"] == state))
+    yield ("mindcare_llm_fallback_replies_total", "counter", "Replies that fell back to FALLBACK_REPLY",
+           None, gemini_service.fallback_count)
+
+    for name, stats in (("response", response_cache.stats()), ("rag_query", cache_stats())):
+        labels = {"cache": name}
+        yield ("mindcare_cache_hits_total", "counter", "Cache hits", labels, stats["hits"])
+        yield ("mindcare_cache_lookups_total", "counter", "Cache lookups", labels,
+               stats.get("lookups", stats.get("hits", 0) + stats.get("misses", 0)))
+        yield ("mindcare_cache_hit_ratio", "gauge", "Cache hits / lookups", labels, stats["hit_rate"])
+        yield ("mindcare_cache_entries", "gauge", "Cache entries", labels, stats.get("entries", stats.get("size")))
+
+    store = conversations.stats()
+    yield ("mindcare_conversation_users", "gauge", "Users with in-memory history", None, store["users"])
+    yield ("mindcare_conversation_turns", "gauge", "Turns held in memory", None, store["turns"])
+    yield ("mindcare_conversation_bytes", "gauge", "UTF-8 bytes held in memory", None, store["bytes"])
+    yield ("mindcare_conversation_evictions_total", "counter", "Users evicted from memory", None, store["evictions"])
+    yield ("mindcare_conversation_lost_turns_total", "counter", "Turns dropped before the summary covered them",
+           None, store["lost_turns"])
+    yield ("mindcare_summary_folds_total", "counter", "Rolling summary updates", None, summarizer.folds)
+
+    admission = chat_admission.stats()
+    yield ("mindcare_chat_in_flight", "gauge", "Chats being processed", None, admission["in_flight"])
+    yield ("mindcare_chat_admitted_total", "counter", "Chats admitted", None, admission["admitted"])
+    yield ("mindcare_chat_crisis_bypass_total", "counter", "Chats admitted past the limits as crisis",
+           None, admission["crisis_bypassed"])
+    for reason, count in admission["rejected"].items():
+        yield ("mindcare_chat_rejected_total", "counter", "Chats shed with 429", {"reason": reason}, count)
@@ -1,3 +1,4 @@
+from datetime import datetime
 from db import db
 from flask_login import UserMixin
 
@@ -7,8 +8,14 @@ class User(UserMixin, db.Model):
     password = db.Column(db.String(200))
 
 class Conversation(db.Model):
+    # /history pages through one user's rows newest first by id
+    __table_args__ = (
+        db.Index("ix_conversation_user_id_id", "user_id", "id"),
+    )
+
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer)
     message = db.Column(db.Text)
     response = db.Column(db.Text)
     emotion = db.Column(db.String(50))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
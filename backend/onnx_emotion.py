@@ -0,0 +1,285 @@
+import argparse
+import json
+import os
+import shutil
+import time
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: exports are not serialized across processes
+    fcntl = None
+
+MODEL_NAME = "j-hartmann/emotion-english-distilroberta-base"
+
+ONNX_MODEL_DIR = os.getenv(
+    "EMOTION_ONNX_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "models", "emotion-onnx")
+)
+ONNX_THREADS = int(os.getenv("EMOTION_ONNX_THREADS", "0"))
+
+FP32_FILE = "model.onnx"
+INT8_FILE = "model.int8.onnx"
+# Written last; a model directory without it is a partial export
+EXPORT_MARKER = "export.json"
+
+SAMPLE_TEXTS = [
+    "I'm feeling down today",
+    "I'm feeling anxious",
+    "I need to vent about something",
+    "I need some advice",
+    "I got the job, I can't believe it!",
+    "Why does everyone keep ignoring me, it makes me furious",
+    "I'm scared something bad is going to happen tonight",
+    "That smell in the kitchen is revolting",
+    "Wow, I did not expect that at all",
+    "I just feel empty and tired all the time",
+    "Today was a normal day, nothing special",
+    "My friends threw me a surprise party and I loved it",
+]
+
+
+# =========================
+# EXPORT + QUANTIZATION
+# =========================
+
+def export_quantized(model_name=MODEL_NAME, out_dir=ONNX_MODEL_DIR):
+    # Everything is written to a sibling temp directory that is renamed into
+    # place once complete, so a crash or a concurrent loader never sees a
+    # half-written model.int8.onnx under out_dir.
+    out_dir = os.path.abspath(out_dir)
+    tmp_dir = f"{out_dir}.{os.getpid()}.tmp"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    try:
+        _export_to(model_name, tmp_dir)
+        with open(os.path.join(tmp_dir, EXPORT_MARKER), "w", encoding="utf-8") as f:
+            json.dump({"model": model_name, "exported_at": time.time()}, f)
+
+        if os.path.isdir(out_dir):
+            # os.replace cannot overwrite a non-empty directory
+            old_dir = f"{out_dir}.{os.getpid()}.old"
+            os.replace(out_dir, old_dir)
+            os.replace(tmp_dir, out_dir)
+            shutil.rmtree(old_dir, ignore_errors=True)
+        else:
+            os.replace(tmp_dir, out_dir)
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    return out_dir
+
+
+def _export_to(model_name, out_dir):
+    import torch
+    from transformers import AutoModelForSequenceClassification, AutoTokenizer
+    from onnxruntime.quantization import quantize_dynamic, QuantType
+
+    tokenizer = AutoTokenizer.from_pretrained(model_name)
+    model = AutoModelForSequenceClassification.from_pretrained(model_name)
+    model.eval()
+
+    dummy = tokenizer(["export sample"], return_tensors="pt")
+    fp32_path = os.path.join(out_dir, FP32_FILE)
+
+    with torch.no_grad():
+        torch.onnx.export(
+            model,
+            (dummy["input_ids"], dummy["attention_mask"]),
+            fp32_path,
+            input_names=["input_ids", "attention_mask"],
+            output_names=["logits"],
+            dynamic_axes={
+                "input_ids": {0: "batch", 1: "sequence"},
+                "attention_mask": {0: "batch", 1: "sequence"},
+                "logits": {0: "batch"}
+            },
+            opset_version=14
+        )
+
+    quantize_dynamic(
+        fp32_path,
+        os.path.join(out_dir, INT8_FILE),
+        weight_type=QuantType.QInt8
+    )
+
+    tokenizer.save_pretrained(out_dir)
+    model.config.save_pretrained(out_dir)
+
+
+def is_exported(model_name=MODEL_NAME, model_dir=ONNX_MODEL_DIR):
+    try:
+        with open(os.path.join(model_dir, EXPORT_MARKER), "r", encoding="utf-8") as f:
+            marker = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return marker.get("model") == model_name and os.path.exists(os.path.join(model_dir, INT8_FILE))
+
+
+class _ExportLock:
+    # Holds an exclusive flock on "<model_dir>.lock" so only one process
+    # (e.g. one of several gunicorn workers) exports at a time
+
+    def __init__(self, model_dir):
+        self.path = os.path.abspath(model_dir) + ".lock"
+        self._file = None
+
+    def __enter__(self):
+        if fcntl is not None:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            self._file = open(self.path, "a")
+            fcntl.flock(self._file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self._file is not None:
+            fcntl.flock(self._file, fcntl.LOCK_UN)
+            self._file.close()
+            self._file = None
+
+
+# =========================
+# ONNX RUNTIME CLASSIFIER
+# =========================
+
+class OnnxEmotionClassifier:
+    # Mirrors the call signature and output of a transformers
+    # text-classification pipeline so it can be swapped in directly.
+
+    def __init__(self, model_dir=ONNX_MODEL_DIR, quantized=True):
+        import onnxruntime as ort
+        from transformers import AutoConfig, AutoTokenizer
+
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+        config = AutoConfig.from_pretrained(model_dir)
+        self.labels = [config.id2label[i] for i in range(len(config.id2label))]
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS > 0:
+            options.intra_op_num_threads = ONNX_THREADS
+
+        model_file = INT8_FILE if quantized else FP32_FILE
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file),
+            options,
+            providers=["CPUExecutionProvider"]
+        )
+
+    def __call__(self, texts, batch_size=None, truncation=True):
+        if isinstance(texts, str):
+            texts = [texts]
+
+        batch_size = batch_size or len(texts)
+        results = []
+        for start in range(0, len(texts), batch_size):
+            results.extend(self._run(texts[start:start + batch_size], truncation))
+        return results
+
+    def _run(self, texts, truncation):
+        encoded = self.tokenizer(
+            texts,
+            padding=True,
+            truncation=truncation,
+            max_length=512,
+            return_tensors="np"
+        )
+        logits = self.session.run(
+            ["logits"],
+            {
+                "input_ids": encoded["input_ids"].astype(np.int64),
+                "attention_mask": encoded["attention_mask"].astype(np.int64)
+            }
+        )[0]
+
+        logits = logits - logits.max(axis=1, keepdims=True)
+        probs = np.exp(logits)
+        probs /= probs.sum(axis=1, keepdims=True)
+        best = probs.argmax(axis=1)
+
+        return [
+            {"label": self.labels[i], "score": float(probs[row, i])}
+            for row, i in enumerate(best)
+        ]
+
+
+def load_onnx_classifier(model_name=MODEL_NAME, model_dir=ONNX_MODEL_DIR):
+    if not is_exported(model_name, model_dir):
+        with _ExportLock(model_dir):
+            # Another process may have finished the export while we waited
+            if not is_exported(model_name, model_dir):
+                export_quantized(model_name, model_dir)
+    return OnnxEmotionClassifier(model_dir)
+
+
+# =========================
+# BACKEND COMPARISON
+# =========================
+
+def _rss_mb():
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+    except (OSError, ValueError):
+        return None
+
+
+def _measure(classifier, texts, repeats):
+    classifier(texts[:1])  # warm-up
+    started = time.perf_counter()
+    for _ in range(repeats):
+        labels = [r["label"] for r in classifier(texts, batch_size=1)]
+    elapsed = time.perf_counter() - started
+    return labels, elapsed * 1000.0 / (repeats * len(texts))
+
+
+def compare_backends(texts=SAMPLE_TEXTS, repeats=3):
+    from transformers import pipeline
+
+    report = {}
+
+    rss_before = _rss_mb()
+    torch_classifier = pipeline("text-classification", model=MODEL_NAME)
+    rss_torch = _rss_mb()
+    torch_labels, torch_ms = _measure(torch_classifier, texts, repeats)
+
+    onnx_classifier = load_onnx_classifier()
+    rss_onnx = _rss_mb()
+    onnx_labels, onnx_ms = _measure(onnx_classifier, texts, repeats)
+
+    matches = sum(a == b for a, b in zip(torch_labels, onnx_labels))
+
+    report["torch"] = {
+        "ms_per_text": round(torch_ms, 2),
+        "rss_delta_mb": round(rss_torch - rss_before, 1) if rss_before else None
+    }
+    report["onnx_int8"] = {
+        "ms_per_text": round(onnx_ms, 2),
+        "rss_delta_mb": round(rss_onnx - rss_torch, 1) if rss_torch else None
+    }
+    report["label_agreement"] = matches / len(texts)
+    report["mismatches"] = [
+        {"text": t, "torch": a, "onnx": b}
+        for t, a, b in zip(texts, torch_labels, onnx_labels) if a != b
+    ]
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="ONNX emotion model tools")
+    parser.add_argument("command", choices=["export", "compare"])
+    parser.add_argument("--texts", help="file with one sample text per line")
+    parser.add_argument("--repeats", type=int, default=3)
+    args = parser.parse_args()
+
+    if args.command == "export":
+        with _ExportLock(ONNX_MODEL_DIR):
+            print(f"Exported to {export_quantized()}")
+    else:
+        texts = SAMPLE_TEXTS
+        if args.texts:
+            with open(args.texts, "r", encoding="utf-8") as f:
+                texts = [line.strip() for line in f if line.strip()]
+        print(json.dumps(compare_backends(texts, args.repeats), indent=2))
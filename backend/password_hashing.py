@@ -0,0 +1,111 @@
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+import bcrypt
+
+# bcrypt cost factor for new hashes; existing hashes keep their own cost
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+
+# "process" hashes in a small process pool so a burst of logins cannot take
+# the CPU (and the GIL-bound request threads) away from /chat; "inline"
+# hashes on the request thread as before.
+PASSWORD_HASH_MODE = os.getenv("PASSWORD_HASH_MODE", "process")
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+# Hashes queued or running at once; beyond this callers get HasherBusy
+# after PASSWORD_HASH_WAIT seconds instead of queueing without bound.
+PASSWORD_HASH_QUEUE_LIMIT = int(os.getenv("PASSWORD_HASH_QUEUE_LIMIT", str(PASSWORD_HASH_WORKERS * 8)))
+PASSWORD_HASH_WAIT = float(os.getenv("PASSWORD_HASH_WAIT", "5"))
+
+
+class HasherBusy(Exception):
+    pass
+
+
+def _secret(password):
+    # bcrypt only uses the first 72 bytes; newer releases raise instead of
+    # truncating, so truncate explicitly as Flask-Bcrypt always did
+    return password.encode("utf-8")[:72]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_secret(password), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _check(hashed, password):
+    try:
+        return bcrypt.checkpw(_secret(password), hashed.encode("utf-8"))
+    except ValueError:
+        return False  # not a bcrypt hash
+
+
+class PasswordHasher:
+
+    def __init__(self, mode=PASSWORD_HASH_MODE, workers=PASSWORD_HASH_WORKERS,
+                 queue_limit=PASSWORD_HASH_QUEUE_LIMIT, wait=PASSWORD_HASH_WAIT, rounds=BCRYPT_ROUNDS):
+        self.mode = mode
+        self.workers = workers
+        self.rounds = rounds
+        self.wait = wait
+        self._slots = threading.BoundedSemaphore(max(1, queue_limit))
+        self._pool = None
+        self._pool_lock = threading.Lock()
+
+        self._stats_lock = threading.Lock()
+        self.hashes = 0
+        self.checks = 0
+        self.rejected = 0
+
+    def _executor(self):
+        if self._pool is None:
+            with self._pool_lock:
+                if self._pool is None:
+                    # spawn, not fork: the parent has model and pipeline
+                    # threads running that fork would copy mid-operation
+                    self._pool = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context("spawn")
+                    )
+        return self._pool
+
+    def _run(self, func, *args):
+        if self.mode != "process":
+            return func(*args)
+
+        if not self._slots.acquire(timeout=self.wait):
+            with self._stats_lock:
+                self.rejected += 1
+            raise HasherBusy("Too many password checks in progress")
+        try:
+            return self._executor().submit(func, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        with self._stats_lock:
+            self.hashes += 1
+        return self._run(_hash, password, self.rounds)
+
+    def check(self, hashed, password):
+        with self._stats_lock:
+            self.checks += 1
+        return self._run(_check, hashed, password)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+
+    def stats(self):
+        with self._stats_lock:
+            return {
+                "mode": self.mode,
+                "workers": self.workers if self.mode == "process" else 0,
+                "rounds": self.rounds,
+                "hashes": self.hashes,
+                "checks": self.checks,
+                "rejected": self.rejected
+            }
+
+
+hasher = PasswordHasher()
@@ -0,0 +1,157 @@
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import llm_client
+from conversation_store import conversations, CONVERSATION_MAX_TURNS
+
+# Token budgets for the conversation part of the prompt. Recent turns are
+# sent verbatim up to PROMPT_HISTORY_TOKENS; older ones are folded into a
+# running summary of at most PROMPT_SUMMARY_TOKENS.
+PROMPT_HISTORY_TOKENS = int(os.getenv("PROMPT_HISTORY_TOKENS", "800"))
+PROMPT_SUMMARY_TOKENS = int(os.getenv("PROMPT_SUMMARY_TOKENS", "200"))
+
+# A small, fast model is plenty for summarising
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "llama-3.1-8b-instant")
+
+SUMMARY_PROMPT = """Update the running summary of a conversation between a user and a mental health support assistant.
+Keep what the user shared about their situation, feelings and goals, and any advice already given.
+Write at most {words} words in plain prose. Return only the summary.
+
+Current summary:
+{summary}
+
+New turns:
+{turns}"""
+
+_TOKEN = re.compile(r"\w+|[^\w\s]")
+
+# Role/formatting overhead the chat API adds per message
+MESSAGE_OVERHEAD = 4
+
+
+def count_tokens(text):
+    # Approximates a BPE tokenizer: one token per punctuation mark and per
+    # ~4 characters of each word. Within ~10-15% for English chat text.
+    return sum((len(piece) + 3) // 4 for piece in _TOKEN.findall(text))
+
+
+def count_message_tokens(messages):
+    return sum(count_tokens(m["content"]) + MESSAGE_OVERHEAD for m in messages)
+
+
+def turn_tokens(turn):
+    return count_tokens(turn.message) + count_tokens(turn.reply) + 2 * MESSAGE_OVERHEAD
+
+
+def select_turns(turns, budget=PROMPT_HISTORY_TOKENS):
+    # Most recent turns that fit in `budget`, oldest first
+    used = 0
+    start = len(turns)
+    while start > 0:
+        cost = turn_tokens(turns[start - 1])
+        if used + cost > budget:
+            break
+        used += cost
+        start -= 1
+    return list(turns[start:])
+
+
+def build_chat_messages(system, user_input, turns, summary=""):
+    messages = [{"role": "system", "content": system}]
+
+    if summary:
+        messages.append({
+            "role": "system",
+            "content": f"Summary of the earlier conversation:\n{summary}"
+        })
+
+    for turn in turns:
+        messages.append({"role": "user", "content": turn.message})
+        messages.append({"role": "assistant", "content": turn.reply})
+
+    messages.append({"role": "user", "content": user_input})
+    return messages
+
+
+# =========================
+# ROLLING SUMMARY
+# =========================
+
+def _truncate(text, budget):
+    pieces = text.split()
+    while pieces and count_tokens(" ".join(pieces)) > budget:
+        pieces = pieces[len(pieces) // 8 + 1:]
+    return " ".join(pieces)
+
+
+def fold_summary(summary, turns, budget=PROMPT_SUMMARY_TOKENS):
+    # Returns the summary with `turns` folded in. Falls back to keeping the
+    # user's own words (newest last) if the LLM is unavailable.
+    lines = "\n".join(f"User: {t.message}\nAssistant: {t.reply}" for t in turns)
+
+    try:
+        folded = llm_client.complete(
+            [{"role": "user", "content": SUMMARY_PROMPT.format(
+                words=int(budget * 0.75),
+                summary=summary or "(none)",
+                turns=lines
+            )}],
+            channel=llm_client.summaries,
+            model=SUMMARY_MODEL,
+            temperature=0.2,
+            max_tokens=budget
+        ).strip()
+    except Exception as e:
+        print(f"Summary fold failed, keeping user messages: {e}", flush=True)
+        folded = " ".join([summary] + [f"User said: {t.message}" for t in turns]).strip()
+
+    return _truncate(folded, budget)
+
+
+def pending_turns(history, budget=PROMPT_HISTORY_TOKENS, max_turns=CONVERSATION_MAX_TURNS):
+    # Turns not in the summary yet that no longer fit verbatim, or that fall
+    # outside the newest max_turns the store keeps once they are summarized
+    recent = min(len(select_turns(history.turns, budget)), max_turns)
+    older = history.turns[:len(history.turns) - recent]
+    return [t for t in older if t.seq >= history.summarized]
+
+
+class Summarizer:
+    """Folds old turns into each conversation's summary off the request path."""
+
+    def __init__(self, store, workers=2):
+        self.store = store
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="summarizer")
+        self._lock = threading.Lock()
+        self._running = set()
+        self.folds = 0
+
+    def schedule(self, user_id):
+        history = self.store.history(user_id)
+        if not pending_turns(history, max_turns=self.store.max_turns):
+            return False
+
+        with self._lock:
+            if user_id in self._running:
+                return False
+            self._running.add(user_id)
+
+        self._executor.submit(self._fold, user_id)
+        return True
+
+    def _fold(self, user_id):
+        try:
+            history = self.store.history(user_id)
+            turns = pending_turns(history, max_turns=self.store.max_turns)
+            if turns:
+                summary = fold_summary(history.summary, turns)
+                self.store.set_summary(user_id, summary, turns[-1].seq + 1)
+                with self._lock:
+                    self.folds += 1
+        finally:
+            with self._lock:
+                self._running.discard(user_id)
+
+
+summarizer = Summarizer(conversations)
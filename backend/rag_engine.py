@@ -1,35 +1,279 @@
-from sentence_transformers import SentenceTransformer
-import faiss
 import numpy as np
 import os
+import threading
+import time
+from lazy import Lazy
+from ttl_cache import TTLCache
+from embedding_cache import encode_with_cache, cached_index, line_hash
+from index_factory import (
+    INDEX_TYPE, build_index, cache_key, configure_search, patched_index, resolve_kind
+)
 
-model = SentenceTransformer("all-MiniLM-L6-v2")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+# Namespace of the knowledge base in the embedding cache
+CACHE_CORPUS = "knowledge"
 
-knowledge_path = "data/mental_health_knowledge.txt"
+knowledge_path = os.getenv(
+    "KNOWLEDGE_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "data", "mental_health_knowledge.txt")
+)
 
-if not os.path.exists(knowledge_path):
-    raise FileNotFoundError("mental_health_knowledge.txt not found")
+# Seconds between checks of the knowledge file for changes (0 = off)
+KNOWLEDGE_WATCH_INTERVAL = float(os.getenv("KNOWLEDGE_WATCH_INTERVAL", "0"))
 
-with open(knowledge_path, "r", encoding="utf-8") as f:
-    knowledge = [line.strip() for line in f.readlines() if line.strip()]
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "2048"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", "3600"))
 
-if len(knowledge) == 0:
-    raise ValueError("Knowledge file is empty. Add some content.")
+TOP_K = 2
 
-# Generate embeddings
-embeddings = model.encode(knowledge)
 
-# Ensure embeddings are 2D
-if len(embeddings.shape) == 1:
-    embeddings = np.expand_dims(embeddings, axis=0)
+def _load_model():
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(EMBEDDING_MODEL_NAME)
 
-dimension = embeddings.shape[1]
 
-index = faiss.IndexFlatL2(dimension)
-index.add(np.array(embeddings))
+model = Lazy("embedding_model", _load_model)
 
 
-def retrieve_context(query):
-    query_vector = model.encode([query])
-    D, I = index.search(np.array(query_vector), k=min(2, len(knowledge)))
-    return [knowledge[i] for i in I[0]]
+def _encode(lines):
+    return model.get().encode(lines)
+
+
+def _read_knowledge():
+    if not os.path.exists(knowledge_path):
+        raise FileNotFoundError("mental_health_knowledge.txt not found")
+
+    with open(knowledge_path, "r", encoding="utf-8") as f:
+        knowledge = [line.strip() for line in f.readlines() if line.strip()]
+
+    if len(knowledge) == 0:
+        raise ValueError("Knowledge file is empty. Add some content.")
+
+    # Duplicate lines would only crowd out other results
+    return list(dict.fromkeys(knowledge))
+
+
+# =========================
+# KNOWLEDGE STORE
+# =========================
+
+class KnowledgeSnapshot:
+    # Immutable once published; readers grab the current snapshot once and
+    # never see a half-applied reload.
+    __slots__ = ("version", "texts", "ids_by_hash", "index")
+
+    def __init__(self, version, texts, ids_by_hash, index):
+        self.version = version
+        self.texts = texts
+        self.ids_by_hash = ids_by_hash
+        self.index = index
+
+    def __len__(self):
+        return len(self.texts)
+
+
+class KnowledgeStore:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_id = 0
+        self.kind = INDEX_TYPE
+        self.snapshot = self._build_full()
+
+    def _build_full(self):
+        knowledge = _read_knowledge()
+        embeddings = encode_with_cache(EMBEDDING_MODEL_NAME, _encode, knowledge, corpus=CACHE_CORPUS)
+        self.kind = resolve_kind(INDEX_TYPE, len(knowledge))
+
+        index = cached_index(
+            EMBEDDING_MODEL_NAME,
+            knowledge,
+            lambda: build_index(embeddings, np.arange(len(knowledge)), self.kind),
+            kind=cache_key(self.kind, len(knowledge)),
+            corpus=CACHE_CORPUS
+        )
+        configure_search(index, self.kind)
+
+        self._next_id = len(knowledge)
+        return KnowledgeSnapshot(
+            version=1,
+            texts={i: text for i, text in enumerate(knowledge)},
+            ids_by_hash={line_hash(text): i for i, text in enumerate(knowledge)},
+            index=index
+        )
+
+    def reload(self):
+        with self._lock:
+            started = time.perf_counter()
+            current = self.snapshot
+            knowledge = _read_knowledge()
+            hashes = [line_hash(text) for text in knowledge]
+            wanted = set(hashes)
+
+            added = [i for i, h in enumerate(hashes) if h not in current.ids_by_hash]
+            removed = [
+                doc_id for h, doc_id in current.ids_by_hash.items() if h not in wanted
+            ]
+
+            if not added and not removed:
+                return {
+                    "version": current.version,
+                    "added": 0,
+                    "removed": 0,
+                    "seconds": time.perf_counter() - started
+                }
+
+            # Only the added lines are encoded; the cache is rewritten so a
+            # restart picks up the same state.
+            embeddings = encode_with_cache(EMBEDDING_MODEL_NAME, _encode, knowledge, corpus=CACHE_CORPUS)
+
+            removed_ids = set(removed)
+            texts = {
+                doc_id: text for doc_id, text in current.texts.items()
+                if doc_id not in removed_ids
+            }
+            ids_by_hash = {
+                h: doc_id for h, doc_id in current.ids_by_hash.items() if h in wanted
+            }
+
+            new_ids = np.arange(self._next_id, self._next_id + len(added), dtype=np.int64)
+            self._next_id += len(added)
+            for doc_id, i in zip(new_ids.tolist(), added):
+                texts[doc_id] = knowledge[i]
+                ids_by_hash[hashes[i]] = doc_id
+
+            # Copy the live index (a memcpy, no re-encoding) and patch it so
+            # in-flight searches keep using the old one untouched
+            index = patched_index(current.index, self.kind, removed, embeddings[added], new_ids)
+            if index is None:
+                # Rebuild from the cached vectors, keeping document ids stable
+                row_by_hash = {h: i for i, h in enumerate(hashes)}
+                rows = [row_by_hash[h] for h in ids_by_hash]
+                index = build_index(
+                    embeddings[rows],
+                    np.array(list(ids_by_hash.values()), dtype=np.int64),
+                    self.kind
+                )
+
+            self.snapshot = KnowledgeSnapshot(
+                version=current.version + 1,
+                texts=texts,
+                ids_by_hash=ids_by_hash,
+                index=index
+            )
+
+            return {
+                "version": self.snapshot.version,
+                "added": len(added),
+                "removed": len(removed),
+                "seconds": time.perf_counter() - started
+            }
+
+
+knowledge_base = Lazy("knowledge_index", KnowledgeStore)
+
+
+def reload_knowledge():
+    return knowledge_base.get().reload()
+
+
+# =========================
+# QUERY CACHE
+# =========================
+
+class _CachedQuery:
+    __slots__ = ("vector", "version", "results")
+
+    def __init__(self, vector, version, results):
+        self.vector = vector
+        self.version = version
+        self.results = results
+
+
+# normalized query -> vector plus the results for one knowledge-base version
+query_cache = TTLCache(QUERY_CACHE_SIZE, QUERY_CACHE_TTL, name="rag_query")
+
+
+def normalize_query(query):
+    # MiniLM is uncased, so case and spacing do not change the embedding
+    return " ".join(query.lower().split())
+
+
+def embed_query(key):
+    # Only the vector is wanted here; hits and misses are counted once per
+    # query, by retrieve_context
+    cached = query_cache.peek(key)
+    if cached is not None:
+        return cached.vector
+
+    vector = np.asarray(model.get().encode([key]), dtype=np.float32)
+    query_cache.put(key, _CachedQuery(vector, None, ()))
+    return vector
+
+
+def retrieve_context(query, features=None):
+    snapshot = knowledge_base.get().snapshot
+    key = features.normalized if features is not None else normalize_query(query)
+
+    # A vector-only entry (from embed_query or an older knowledge base)
+    # still needs a search, so it counts as a miss
+    cached = query_cache.get(key, usable=lambda entry: entry.version == snapshot.version)
+    if cached is not None and cached.version == snapshot.version:
+        return list(cached.results)
+
+    if cached is not None:
+        query_vector = cached.vector
+    elif features is not None:
+        query_vector = features.embedding
+    else:
+        query_vector = np.asarray(model.get().encode([key]), dtype=np.float32)
+
+    D, I = snapshot.index.search(query_vector, k=min(TOP_K, len(snapshot)))
+    results = [snapshot.texts[i] for i in I[0] if i in snapshot.texts]
+
+    query_cache.put(key, _CachedQuery(query_vector, snapshot.version, tuple(results)))
+    return results
+
+
+def cache_stats():
+    return query_cache.stats()
+
+
+# =========================
+# FILE WATCHER
+# =========================
+
+def _file_signature():
+    try:
+        stat = os.stat(knowledge_path)
+        return stat.st_mtime_ns, stat.st_size
+    except OSError:
+        return None
+
+
+def start_watcher(interval=KNOWLEDGE_WATCH_INTERVAL):
+    if interval <= 0:
+        return None
+
+    def watch():
+        last = _file_signature()
+        while True:
+            time.sleep(interval)
+            signature = _file_signature()
+            if signature is None or signature == last:
+                continue
+            last = signature
+
+            # Not loaded yet: the first lazy load reads the new file anyway
+            if not knowledge_base.loaded:
+                continue
+
+            try:
+                result = reload_knowledge()
+                print(f"Knowledge base reloaded: {result}", flush=True)
+            except Exception as e:
+                print(f"Knowledge base reload failed: {e}", flush=True)
+
+    thread = threading.Thread(target=watch, name="knowledge-watcher", daemon=True)
+    thread.start()
+    return thread
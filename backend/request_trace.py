@@ -0,0 +1,173 @@
+import contextvars
+import cProfile
+import hmac
+import os
+import pstats
+import random
+import re
+import threading
+import time
+import uuid
+from functools import partial
+
+# Per-request ID, stage timings for the Server-Timing header and opt-in
+# cProfile capture. The active trace lives in a context variable; work
+# handed to pipeline or inference threads through bind() sees it too, so
+# their stage timings and profiles land on the request that caused them.
+
+# Profile a request when it sends "X-Profile: <PROFILE_TOKEN>" (falls back
+# to ADMIN_TOKEN), or at random for PROFILE_SAMPLE_RATE of all requests.
+PROFILE_TOKEN = os.getenv("PROFILE_TOKEN") or os.getenv("ADMIN_TOKEN")
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_DIR = os.getenv(
+    "PROFILE_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "cache", "profiles")
+)
+
+# Client-supplied request IDs are kept if they look like one
+_REQUEST_ID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+_current = contextvars.ContextVar("request_trace", default=None)
+
+
+class RequestProfile:
+    """cProfile output of one request, merged across the threads it ran on."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._profiles = []
+        self._caller = None
+
+    def _add(self, profile):
+        with self._lock:
+            self._profiles.append(profile)
+
+    def start_caller(self):
+        # Profiles the calling thread until stop_caller()
+        self._caller = _enable()
+
+    def stop_caller(self):
+        if self._caller is not None:
+            self._caller.disable()
+            self._add(self._caller)
+            self._caller = None
+
+    def run(self, func, *args):
+        profile = _enable()
+        if profile is None:
+            return func(*args)
+        try:
+            return func(*args)
+        finally:
+            profile.disable()
+            self._add(profile)
+
+    def dump(self, path):
+        with self._lock:
+            profiles = list(self._profiles)
+        if not profiles:
+            return None
+
+        stats = pstats.Stats(profiles[0])
+        for profile in profiles[1:]:
+            stats.add(profile)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        stats.dump_stats(path)
+        return path
+
+
+def _enable():
+    profile = cProfile.Profile()
+    try:
+        profile.enable()
+    except ValueError:
+        return None  # another profiler already owns this interpreter
+    return profile
+
+
+class RequestTrace:
+    __slots__ = ("request_id", "name", "started", "timings", "profile")
+
+    def __init__(self, request_id, name):
+        self.request_id = request_id
+        self.name = name
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.profile = None
+
+    def server_timing(self):
+        # e.g. crisis;dur=1.2, emotion;dur=31.0, app;dur=412.7, reqid;desc="..."
+        entries = [f"{name};dur={ms:.1f}" for name, ms in self.timings.items()]
+        entries.append(f"app;dur={(time.perf_counter() - self.started) * 1000.0:.1f}")
+        entries.append(f'reqid;desc="{self.request_id}"')
+        return ", ".join(entries)
+
+
+def _request_id(incoming):
+    if incoming and _REQUEST_ID.match(incoming):
+        return incoming
+    return uuid.uuid4().hex
+
+
+def wants_profile(header):
+    if header and PROFILE_TOKEN and hmac.compare_digest(header, PROFILE_TOKEN):
+        return True
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+def begin(name, request_id=None, profile=False, profile_caller=True):
+    """Starts the trace for the current request. ``profile_caller=False``
+    profiles only work run through bind() (used on the event loop, where
+    the calling thread is shared by every request)."""
+    trace = RequestTrace(_request_id(request_id), name)
+    if profile:
+        trace.profile = RequestProfile()
+        if profile_caller:
+            trace.profile.start_caller()
+    _current.set(trace)
+    return trace
+
+
+def resume(trace):
+    # Makes ``trace`` current again, e.g. in a response body generator that
+    # runs after the request context was torn down
+    _current.set(trace)
+
+
+def end(trace):
+    # Returns the profile file written for this request, if any
+    if _current.get() is trace:
+        _current.set(None)
+
+    profile = trace.profile
+    if profile is None:
+        return None
+    trace.profile = None
+    profile.stop_caller()
+
+    filename = f"{time.strftime('%Y%m%d-%H%M%S')}-{trace.name}-{trace.request_id}.prof"
+    path = profile.dump(os.path.join(PROFILE_DIR, filename))
+    if path:
+        print(f"Profile of {trace.name} written to {path}", flush=True)
+    return path
+
+
+def record_timing(name, seconds):
+    trace = _current.get()
+    if trace is not None:
+        trace.timings[name] = trace.timings.get(name, 0.0) + seconds * 1000.0
+
+
+def _run_traced(func, *args):
+    trace = _current.get()
+    if trace is None or trace.profile is None:
+        return func(*args)
+    return trace.profile.run(func, *args)
+
+
+def bind(func):
+    """Wraps ``func`` for another thread so it runs under the caller's
+    trace. Outside a trace ``func`` is returned unchanged."""
+    if _current.get() is None:
+        return func
+    return partial(contextvars.copy_context().run, _run_traced, func)
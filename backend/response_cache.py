@@ -0,0 +1,126 @@
+import itertools
+import os
+import random
+import threading
+import numpy as np
+from ttl_cache import TTLCache
+
+# Opt-in. Only first turns (empty history) are looked up or stored, and only
+# messages that already passed crisis detection ever reach the cache.
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE", "0") == "1"
+
+# Cosine similarity between MiniLM embeddings needed to reuse a reply
+RESPONSE_CACHE_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.9"))
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL = float(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+
+# Replies collected per entry before it starts serving from the cache, so
+# repeated openers get one of several answers instead of the same one
+RESPONSE_CACHE_VARIANTS = int(os.getenv("RESPONSE_CACHE_VARIANTS", "3"))
+
+
+def _unit(vector):
+    vector = np.asarray(vector, dtype=np.float32).reshape(-1)
+    return vector / (np.linalg.norm(vector) or 1.0)
+
+
+class _Entry:
+    __slots__ = ("id", "emotion", "vector", "replies")
+
+    def __init__(self, entry_id, emotion, vector, reply):
+        self.id = entry_id
+        self.emotion = emotion
+        self.vector = vector
+        self.replies = [reply]
+
+
+class SemanticResponseCache:
+    """Reuses LLM replies for messages that mean the same thing.
+
+    Entries are keyed by (message embedding, detected emotion). A lookup
+    matches the most similar entry with the same emotion above
+    ``threshold``; once that entry holds ``variants`` replies, one of them
+    is returned at random. Eviction (LRU + TTL) is done by TTLCache.
+    """
+
+    def __init__(self, threshold=RESPONSE_CACHE_THRESHOLD, max_size=RESPONSE_CACHE_SIZE,
+                 ttl=RESPONSE_CACHE_TTL, variants=RESPONSE_CACHE_VARIANTS,
+                 enabled=RESPONSE_CACHE_ENABLED):
+        self.enabled = enabled
+        self.threshold = threshold
+        self.variants = max(1, variants)
+        self._entries = TTLCache(max_size, ttl, name="response")
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+
+        self.lookups = 0
+        self.hits = 0
+        self.stores = 0
+
+    def _match(self, vector, emotion):
+        candidates = [entry for entry in self._entries.values() if entry.emotion == emotion]
+        if not candidates:
+            return None, 0.0
+
+        scores = np.stack([entry.vector for entry in candidates]) @ vector
+        best = int(np.argmax(scores))
+        return candidates[best], float(scores[best])
+
+    def lookup(self, vector, emotion):
+        # Returns (entry, reply). reply is None on a miss, or while the
+        # matched entry is still collecting variants; pass the entry back to
+        # add() so the new reply joins it.
+        vector = _unit(vector)
+        entry, score = self._match(vector, emotion)
+
+        with self._lock:
+            self.lookups += 1
+
+        if entry is None or score < self.threshold:
+            return None, None
+
+        # Refreshes the entry's LRU position and TTL bookkeeping
+        if self._entries.get(entry.id) is None:
+            return None, None
+
+        with self._lock:
+            if len(entry.replies) < self.variants:
+                return entry, None
+            self.hits += 1
+            return entry, random.choice(entry.replies)
+
+    def add(self, vector, emotion, reply, entry=None):
+        with self._lock:
+            self.stores += 1
+            if entry is not None:
+                if len(entry.replies) < self.variants and reply not in entry.replies:
+                    entry.replies.append(reply)
+                return entry
+            entry = _Entry(next(self._ids), emotion, _unit(vector), reply)
+
+        self._entries.put(entry.id, entry)
+        return entry
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        entries = self._entries.stats()
+        with self._lock:
+            return {
+                "enabled": self.enabled,
+                "threshold": self.threshold,
+                "variants": self.variants,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+                "stores": self.stores,
+                "entries": entries["size"],
+                "max_entries": entries["max_size"],
+                "ttl_seconds": entries["ttl_seconds"],
+                "evictions": entries["evictions"],
+                "expirations": entries["expirations"]
+            }
+
+
+response_cache = SemanticResponseCache()
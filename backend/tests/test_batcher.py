@@ -0,0 +1,48 @@
+import threading
+import pytest
+from batcher import MicroBatcher
+
+
+def _bucket(text):
+    if text == "boom":
+        raise ValueError("tokenizer failed")
+    return len(text)
+
+
+def _submit(batcher, item, timeout=5):
+    # Returns (result, error); fails the test instead of hanging
+    outcome = []
+
+    def call():
+        try:
+            outcome.append((batcher.submit(item), None))
+        except Exception as e:
+            outcome.append((None, e))
+
+    caller = threading.Thread(target=call, daemon=True)
+    caller.start()
+    caller.join(timeout)
+    assert outcome, f"submit({item!r}) never returned"
+    return outcome[0]
+
+
+def test_failing_bucket_key_fails_the_batch_and_keeps_the_worker():
+    batcher = MicroBatcher(lambda texts: [t.upper() for t in texts], max_wait_ms=1, bucket_key=_bucket)
+
+    result, error = _submit(batcher, "boom")
+    assert isinstance(error, ValueError)
+
+    worker = batcher._worker
+    assert _submit(batcher, "fine") == ("FINE", None)
+    assert batcher._worker is worker and worker.is_alive()
+
+
+def test_failing_run_batch_raises_in_every_caller():
+    def run_batch(texts):
+        raise RuntimeError("model crashed")
+
+    batcher = MicroBatcher(run_batch, max_wait_ms=1)
+
+    for item in ("a", "b"):
+        with pytest.raises(RuntimeError):
+            batcher.submit(item)
@@ -0,0 +1,24 @@
+import time
+import emotion_model
+from chat_pipeline import Stage
+from lazy import Lazy
+
+
+def _slow_classifier():
+    time.sleep(0.6)
+    return lambda texts, **kwargs: [{"label": "joy"} for _ in texts]
+
+
+def test_emotion_model_loading_on_the_batcher_thread_is_not_a_timeout(monkeypatch):
+    monkeypatch.setattr(emotion_model, "classifier", Lazy("test_emotion_classifier", _slow_classifier))
+    stage = Stage("emotion", emotion_model.detect_emotion, timeout=0.2, fallback=lambda *a: "neutral")
+
+    assert stage.run("I got the job!") == "joy"
+    assert stage.stats()["timeouts"] == 0
+
+
+def test_slow_call_without_a_load_still_times_out():
+    stage = Stage("slow", lambda text: time.sleep(0.5) or text, timeout=0.1, fallback=lambda *a: "fallback")
+
+    assert stage.run("x") == "fallback"
+    assert stage.stats()["timeouts"] == 1
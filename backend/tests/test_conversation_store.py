@@ -0,0 +1,54 @@
+import time
+import prompt_builder
+from conversation_store import ConversationStore
+from prompt_builder import Summarizer
+
+
+def _fold(summary, turns, budget=prompt_builder.PROMPT_SUMMARY_TOKENS):
+    return " ".join([summary] + [t.message for t in turns]).strip()
+
+
+def _settle(summarizer, user_id):
+    while True:
+        while summarizer._running:
+            time.sleep(0.01)
+        if not summarizer.schedule(user_id):
+            return
+
+
+def _remembered(store, user_id):
+    history = store.history(user_id)
+    return set(history.summary.split()) | {t.message for t in history.turns}
+
+
+def test_short_turns_past_max_turns_reach_the_summary(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "fold_summary", _fold)
+    store = ConversationStore(max_turns=20)
+    summarizer = Summarizer(store)
+
+    # 30 turns that all fit in the prompt's token budget
+    for i in range(30):
+        store.append(1, f"m{i}", "ok")
+        summarizer.schedule(1)
+    _settle(summarizer, 1)
+
+    history = store.history(1)
+    assert len(history) <= 20
+    assert _remembered(store, 1) == {f"m{i}" for i in range(30)}
+    assert store.stats()["lost_turns"] == 0
+
+
+def test_unsummarized_turns_wait_for_a_lagging_summarizer(monkeypatch):
+    monkeypatch.setattr(prompt_builder, "fold_summary", _fold)
+    store = ConversationStore(max_turns=20)
+
+    for i in range(30):
+        store.append(1, f"m{i}", "ok")
+    assert len(store.history(1)) == 30
+
+    summarizer = Summarizer(store)
+    _settle(summarizer, 1)
+
+    assert len(store.history(1)) == 20
+    assert _remembered(store, 1) == {f"m{i}" for i in range(30)}
+    assert store.stats()["lost_turns"] == 0
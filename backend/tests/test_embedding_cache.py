@@ -0,0 +1,52 @@
+import numpy as np
+from embedding_cache import cached_index, encode_with_cache
+
+MODEL = "all-MiniLM-L6-v2"
+
+
+class CountingEncoder:
+
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, lines):
+        self.calls.append(len(lines))
+        return np.array([[len(line), sum(map(ord, line)) % 97, 1.0] for line in lines], dtype=np.float32)
+
+
+def test_corpora_sharing_a_model_keep_their_own_cache(tmp_path):
+    knowledge = ["Breathing exercises help.", "Sleep matters.", "Talk to someone.", "Move a little.", "Eat well."]
+    app_knowledge = ["Anxiety can cause worry.", "Depression lowers energy.", "Mindfulness helps."]
+    encode = CountingEncoder()
+
+    for corpus, lines in (("knowledge", knowledge), ("streamlit", app_knowledge),
+                          ("knowledge", knowledge), ("streamlit", app_knowledge)):
+        encode_with_cache(MODEL, encode, lines, cache_dir=str(tmp_path), corpus=corpus)
+
+    # Only the first load of each corpus encodes anything
+    assert encode.calls == [5, 3]
+
+
+def test_saved_index_survives_another_corpus(tmp_path):
+    import faiss
+
+    encode = CountingEncoder()
+    builds = []
+
+    def load(corpus, lines):
+        vectors = encode_with_cache(MODEL, encode, lines, cache_dir=str(tmp_path), corpus=corpus)
+
+        def build():
+            builds.append(corpus)
+            index = faiss.IndexFlatL2(vectors.shape[1])
+            index.add(np.ascontiguousarray(vectors))
+            return index
+
+        return cached_index(MODEL, lines, build, cache_dir=str(tmp_path), corpus=corpus)
+
+    load("knowledge", ["a", "bb", "ccc"])
+    load("streamlit", ["dddd", "eeeee"])
+    index = load("knowledge", ["a", "bb", "ccc"])
+
+    assert builds == ["knowledge", "streamlit"]
+    assert index.ntotal == 3
@@ -0,0 +1,51 @@
+import numpy as np
+import rag_engine
+from lazy import Lazy
+from message_features import MessageFeatures
+from rag_engine import KnowledgeSnapshot
+from ttl_cache import TTLCache
+
+
+class FakeEncoder:
+
+    def encode(self, lines):
+        return np.array([[len(line), 1.0] for line in lines], dtype=np.float32)
+
+
+class FakeIndex:
+
+    def search(self, vectors, k):
+        return np.zeros((1, k), dtype=np.float32), np.arange(k, dtype=np.int64).reshape(1, k)
+
+
+class FakeStore:
+
+    def __init__(self):
+        self.snapshot = KnowledgeSnapshot(
+            version=1,
+            texts={0: "Breathing exercises help.", 1: "Sleep matters."},
+            ids_by_hash={},
+            index=FakeIndex()
+        )
+
+
+def _counts():
+    stats = rag_engine.cache_stats()
+    return stats["hits"], stats["misses"]
+
+
+def test_embedding_a_new_query_does_not_count_as_a_hit(monkeypatch):
+    monkeypatch.setattr(rag_engine, "model", Lazy("test_embedding_model", FakeEncoder))
+    monkeypatch.setattr(rag_engine, "knowledge_base", Lazy("test_knowledge_index", FakeStore))
+    monkeypatch.setattr(rag_engine, "query_cache", TTLCache(16, 60, name="rag_query"))
+
+    # As in /chat: the crisis stage embeds the message first
+    features = MessageFeatures("I can't sleep")
+    assert features.embedding is not None
+    assert rag_engine.retrieve_context(features.text, features) == ["Breathing exercises help.", "Sleep matters."]
+    assert _counts() == (0, 1)
+
+    features = MessageFeatures("I can't  SLEEP")
+    assert features.embedding is not None
+    assert rag_engine.retrieve_context(features.text, features) == ["Breathing exercises help.", "Sleep matters."]
+    assert _counts() == (1, 1)
@@ -0,0 +1,44 @@
+from write_behind import WriteBehindQueue
+
+
+class FlakyWriter:
+
+    def __init__(self, failures=0, bad=()):
+        self.failures = failures
+        self.bad = set(bad)
+        self.rows = []
+
+    def __call__(self, rows):
+        if self.failures:
+            self.failures -= 1
+            raise RuntimeError("database is locked")
+        if self.bad & {row["id"] for row in rows}:
+            raise ValueError("bad row")
+        self.rows.extend(rows)
+
+
+def test_batch_that_fails_once_is_retried():
+    writer = FlakyWriter(failures=1)
+    queue = WriteBehindQueue(writer, max_batch_size=8, max_delay_ms=20, retry_backoff_ms=1)
+
+    for i in range(5):
+        queue.submit({"id": i})
+    assert queue.flush(timeout=5)
+
+    assert sorted(row["id"] for row in writer.rows) == list(range(5))
+    stats = queue.stats()
+    assert stats["failed"] == 0
+    assert stats["committed"] == 5
+    assert stats["retried_batches"] == 1
+
+
+def test_only_rows_that_keep_failing_are_lost():
+    writer = FlakyWriter(bad={2})
+    queue = WriteBehindQueue(writer, max_batch_size=8, max_delay_ms=20, retries=1, retry_backoff_ms=1)
+
+    for i in range(5):
+        queue.submit({"id": i})
+    assert queue.flush(timeout=5)
+
+    assert sorted(row["id"] for row in writer.rows) == [0, 1, 3, 4]
+    assert queue.stats()["failed"] == 1
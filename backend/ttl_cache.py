@@ -0,0 +1,95 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire after ``ttl`` seconds."""
+
+    def __init__(self, max_size=1024, ttl=3600.0, name="cache"):
+        self.name = name
+        self.max_size = max(1, int(max_size))
+        self.ttl = float(ttl)
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key, default=None, usable=None):
+        # usable(value) -> False: the entry is still returned, but counted as
+        # a miss (it only saves part of the work)
+        return self._lookup(key, default, count=True, usable=usable)
+
+    def peek(self, key, default=None):
+        # Like get(), without touching the hit/miss counters
+        return self._lookup(key, default, count=False)
+
+    def _lookup(self, key, default, count, usable=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += count
+                return default
+
+            expires_at, value = entry
+            if self.ttl > 0 and expires_at <= now:
+                del self._data[key]
+                self.expirations += 1
+                self.misses += count
+                return default
+
+            self._data.move_to_end(key)
+            if count:
+                if usable is None or usable(value):
+                    self.hits += 1
+                else:
+                    self.misses += 1
+            return value
+
+    def put(self, key, value):
+        expires_at = time.monotonic() + self.ttl
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def pop(self, key, default=None):
+        with self._lock:
+            entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def values(self):
+        # Snapshot of live entries; does not count as hits or refresh LRU order
+        now = time.monotonic()
+        with self._lock:
+            return [
+                value for expires_at, value in self._data.values()
+                if self.ttl <= 0 or expires_at > now
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations
+            }
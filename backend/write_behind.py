@@ -0,0 +1,191 @@
+import queue
+import threading
+import time
+
+
+class WriteBehindQueue:
+    """Buffers rows in memory and writes them in batches on one thread.
+
+    ``write_batch(rows)`` is called with up to ``max_batch_size`` rows once
+    that many are queued or the oldest has waited ``max_delay_ms``. When
+    ``max_queue`` rows are waiting, ``submit`` blocks for up to
+    ``enqueue_timeout`` seconds and then raises ``queue.Full`` so the
+    caller can write synchronously instead.
+
+    The rows were already acknowledged, so a failed batch (e.g. "database
+    is locked") is retried ``retries`` times with exponential backoff from
+    ``retry_backoff_ms``, then written one row at a time; only rows that
+    still fail count as ``failed``.
+
+    Rows that are queued but not yet committed are lost if the process
+    dies; ``stop()`` (registered at exit by the caller) drains the queue.
+    """
+
+    def __init__(self, write_batch, max_batch_size=64, max_delay_ms=50.0, max_queue=10000,
+                 enqueue_timeout=1.0, retries=3, retry_backoff_ms=100.0, name="write_behind"):
+        self.write_batch = write_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_delay = max(0.0, float(max_delay_ms)) / 1000.0
+        self.enqueue_timeout = enqueue_timeout
+        self.retries = max(0, int(retries))
+        self.retry_backoff = max(0.0, float(retry_backoff_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue(maxsize=max(1, int(max_queue)))
+        self._stopping = threading.Event()
+        self._worker = None
+        self._worker_lock = threading.Lock()
+        self._last_error = None
+
+        self._stats_lock = threading.Lock()
+        self.enqueued = 0
+        self.committed = 0
+        self.failed = 0
+        self.rejected = 0
+        self.retried = 0
+        self.batches = 0
+        self.max_depth = 0
+        self.commit_total = 0.0
+        self.last_commit = None
+
+    # =========================
+    # PUBLIC API
+    # =========================
+
+    def submit(self, row):
+        if self._stopping.is_set():
+            raise queue.Full(f"{self.name} is shutting down")
+        self._ensure_worker()
+
+        try:
+            self._queue.put(row, timeout=self.enqueue_timeout)
+        except queue.Full:
+            with self._stats_lock:
+                self.rejected += 1
+            raise
+
+        depth = self._queue.qsize()
+        with self._stats_lock:
+            self.enqueued += 1
+            self.max_depth = max(self.max_depth, depth)
+
+    def flush(self, timeout=None):
+        # Waits until every row queued so far has been written (or failed)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._queue.all_tasks_done:
+            while self._queue.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._queue.all_tasks_done.wait(remaining)
+        return True
+
+    def stop(self, timeout=10.0):
+        self._stopping.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+        return self._queue.unfinished_tasks == 0
+
+    def stats(self):
+        with self._stats_lock:
+            batches = self.batches
+            last_commit = self.last_commit
+            return {
+                "mode": "write_behind",
+                # Rows acknowledged to clients but not yet on disk
+                "durability": {
+                    "unflushed_rows": self._queue.unfinished_tasks,
+                    "max_unflushed_rows": self._queue.maxsize,
+                    "max_flush_delay_ms": self.max_delay * 1000.0,
+                    "last_commit_age_s": time.monotonic() - last_commit if last_commit else None
+                },
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth_seen": self.max_depth,
+                "enqueued": self.enqueued,
+                "committed": self.committed,
+                "failed": self.failed,
+                "rejected": self.rejected,
+                "retried_batches": self.retried,
+                "batches": batches,
+                "avg_batch_size": self.committed / batches if batches else 0.0,
+                "avg_commit_ms": self.commit_total / batches * 1000.0 if batches else 0.0
+            }
+
+    # =========================
+    # WORKER
+    # =========================
+
+    def _ensure_worker(self):
+        if self._worker is not None:
+            return
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._worker.start()
+
+    def _collect(self):
+        # Blocks for the first row, then gathers more until the batch is
+        # full or the first row has waited max_delay.
+        try:
+            rows = [self._queue.get(timeout=0.1)]
+        except queue.Empty:
+            return []
+
+        deadline = time.monotonic() + self.max_delay
+        while len(rows) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                rows.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return rows
+
+    def _run(self):
+        while True:
+            rows = self._collect()
+            if not rows:
+                if self._stopping.is_set():
+                    return
+                continue
+
+            try:
+                self._write(rows)
+            finally:
+                for _ in rows:
+                    self._queue.task_done()
+
+    def _write(self, rows):
+        for attempt in range(self.retries + 1):
+            if attempt:
+                with self._stats_lock:
+                    self.retried += 1
+                time.sleep(self.retry_backoff * (2 ** (attempt - 1)))
+            if self._commit(rows):
+                return
+
+        if len(rows) == 1:
+            error = self._last_error
+        else:
+            # One bad row should not take the rest of the batch with it
+            failed = [row for row in rows if not self._commit([row])]
+            if not failed:
+                return
+            rows, error = failed, self._last_error
+
+        print(f"{self.name}: failed to write {len(rows)} rows: {error}", flush=True)
+        with self._stats_lock:
+            self.failed += len(rows)
+
+    def _commit(self, rows):
+        started = time.perf_counter()
+        try:
+            self.write_batch(rows)
+        except Exception as e:
+            self._last_error = e
+            return False
+        with self._stats_lock:
+            self.committed += len(rows)
+            self.batches += 1
+            self.commit_total += time.perf_counter() - started
+            self.last_commit = time.monotonic()
+        return True
@@ -0,0 +1,203 @@
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Dict, Iterator, List, Optional, Tuple
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# HTTP client for the backend, shared by every Streamlit call site: one
+# pooled requests.Session per process, a (connect, read) timeout per
+# endpoint, retries for GETs and failed connects, latency per endpoint.
+
+# (connect, read) seconds
+TIMEOUTS: Dict[str, Tuple[float, float]] = {
+    "login": (3.05, 15),
+    "register": (3.05, 15),
+    "history": (3.05, 10),
+    "chat_stream": (3.05, 60),
+}
+DEFAULT_TIMEOUT = (3.05, 10)
+
+LATENCY_WINDOW = 200
+
+
+class BackendError(Exception):
+    # The backend answered with an error status
+
+    def __init__(self, status: int, message: str):
+        super().__init__(f"{status}: {message}")
+        self.status = status
+        self.message = message
+
+
+class BackendUnavailable(BackendError):
+    # The backend could not be reached or did not answer in time
+
+    def __init__(self, message: str):
+        super().__init__(0, message)
+
+
+@dataclass
+class HistoryPage:
+    items: List[dict] = field(default_factory=list)
+    has_more: bool = False
+    next_before_id: Optional[int] = None
+    etag: Optional[str] = None
+    not_modified: bool = False
+
+
+class _Latency:
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.samples = deque(maxlen=LATENCY_WINDOW)
+
+    def snapshot(self) -> dict:
+        samples = sorted(self.samples)
+        if not samples:
+            return {"count": self.count, "errors": self.errors}
+
+        def pct(p):
+            return samples[min(len(samples) - 1, int(p * len(samples)))] * 1000.0
+
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "avg_ms": sum(samples) / len(samples) * 1000.0,
+            "p50_ms": pct(0.50),
+            "p95_ms": pct(0.95),
+            "max_ms": samples[-1] * 1000.0
+        }
+
+
+class BackendClient:
+
+    def __init__(self, base_url: str, pool_size: int = 10, retries: int = 2, backoff: float = 0.3):
+        self.base_url = base_url.rstrip("/")
+
+        retry = Retry(
+            total=retries,
+            connect=retries,
+            read=retries,
+            status=retries,
+            # POSTs (login, chat) are not idempotent: only retried when the
+            # connection could not be made, never after being sent
+            allowed_methods=frozenset({"GET", "HEAD"}),
+            status_forcelist=(502, 503, 504),
+            backoff_factor=backoff,
+            respect_retry_after_header=True,
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self._lock = threading.Lock()
+        self._latency = defaultdict(_Latency)
+
+    # =========================
+    # ENDPOINTS
+    # =========================
+
+    def login(self, username: str, password: str) -> int:
+        res = self._request("login", "POST", "/login", json={"username": username, "password": password})
+        return res.json()["user_id"]
+
+    def register(self, username: str, password: str) -> None:
+        self._request("register", "POST", "/register", json={"username": username, "password": password})
+
+    def history(self, user_id: int, limit: int, since_id: Optional[int] = None,
+                etag: Optional[str] = None) -> HistoryPage:
+        params = {"user_id": user_id, "limit": limit}
+        if since_id is not None:
+            params["since_id"] = since_id
+        headers = {"If-None-Match": etag} if etag else {}
+
+        res = self._request("history", "GET", "/history", params=params, headers=headers)
+        if res.status_code == 304:
+            return HistoryPage(etag=res.headers.get("ETag", etag), not_modified=True)
+
+        page = res.json()
+        return HistoryPage(
+            items=page["items"],
+            has_more=page["has_more"],
+            next_before_id=page["next_before_id"],
+            etag=res.headers.get("ETag")
+        )
+
+    def chat_stream(self, message: str, user_id: int) -> Iterator[dict]:
+        # Yields the server-sent events of /chat/stream as dicts
+        started = time.perf_counter()
+        res = self._request(
+            "chat_stream", "POST", "/chat/stream",
+            json={"message": message, "user_id": user_id},
+            stream=True
+        )
+
+        res.encoding = "utf-8"
+        first = True
+        try:
+            for line in res.iter_lines(decode_unicode=True):
+                if not line or not line.startswith("data: "):
+                    continue
+                if first:
+                    self._record("chat_stream_first_event", time.perf_counter() - started)
+                    first = False
+                yield json.loads(line[len("data: "):])
+        except requests.RequestException as e:
+            self._record("chat_stream_total", time.perf_counter() - started, error=True)
+            raise BackendUnavailable(str(e)) from e
+        finally:
+            res.close()
+
+        self._record("chat_stream_total", time.perf_counter() - started)
+
+    def latency_stats(self) -> Dict[str, dict]:
+        with self._lock:
+            return {name: latency.snapshot() for name, latency in self._latency.items()}
+
+    # =========================
+    # TRANSPORT
+    # =========================
+
+    def _record(self, endpoint: str, seconds: float, error: bool = False) -> None:
+        with self._lock:
+            latency = self._latency[endpoint]
+            latency.count += 1
+            if error:
+                latency.errors += 1
+            else:
+                latency.samples.append(seconds)
+
+    def _request(self, endpoint: str, method: str, path: str, **kwargs) -> requests.Response:
+        started = time.perf_counter()
+        try:
+            res = self.session.request(
+                method,
+                self.base_url + path,
+                timeout=TIMEOUTS.get(endpoint, DEFAULT_TIMEOUT),
+                **kwargs
+            )
+        except requests.RequestException as e:
+            self._record(endpoint, time.perf_counter() - started, error=True)
+            raise BackendUnavailable(str(e)) from e
+
+        failed = res.status_code >= 400
+        # For streams this is the time to the response headers
+        self._record(endpoint, time.perf_counter() - started, error=failed)
+
+        if failed:
+            try:
+                message = res.json().get("error", res.reason)
+            except ValueError:
+                message = res.reason
+            res.close()
+            raise BackendError(res.status_code, message)
+
+        return res
@@ -1,9 +1,10 @@
 import streamlit as st
-import requests
 from datetime import datetime
 import os
+from backend_client import BackendClient, BackendError, BackendUnavailable
 
 BASE_URL = os.getenv("BACKEND_URL", "http://127.0.0.1:5000")
+HISTORY_SIDEBAR_SIZE = 8
 
 # Page config
 st.set_page_config(
@@ -338,6 +339,109 @@ if "username" not in st.session_state:
     st.session_state.username = ""
 if "messages" not in st.session_state:
     st.session_state.messages = []
+if "history_items" not in st.session_state:
+    st.session_state.history_items = []
+    st.session_state.history_etag = None
+    st.session_state.history_stale = True
+
+
+@st.cache_resource
+def load_backend_client():
+    # One pooled HTTP session per Streamlit process, shared by all sessions
+    return BackendClient(BASE_URL)
+
+
+backend = load_backend_client()
+
+
+def reset_history_cache():
+    st.session_state.history_items = []
+    st.session_state.history_etag = None
+    st.session_state.history_stale = True
+
+# ==========================================
+# MESSAGE RENDERING + STREAMING
+# ==========================================
+
+def user_message_html(content):
+    return f"""
+            <div class="message-container user">
+                <div class="message-content">
+                    <div class="avatar user">👤</div>
+                    <div class="message-text">{content}</div>
+                </div>
+            </div>
+            """
+
+
+def assistant_message_html(content, emotion):
+    emotion = (emotion or "neutral").lower()
+    emotion_class = f"emotion-{emotion}" if emotion in ['joy', 'sadness', 'anger', 'fear', 'surprise', 'disgust'] else 'emotion-neutral'
+    return f"""
+            <div class="message-container assistant">
+                <div class="message-content">
+                    <div class="avatar assistant">🧠</div>
+                    <div class="message-text">
+                        {content}
+                        <br><span class="emotion-badge {emotion_class}">Detected: {emotion.capitalize()}</span>
+                    </div>
+                </div>
+            </div>
+            """
+
+
+def stream_chat(message):
+    # Shows the user's message, then renders the reply token by token from
+    # /chat/stream. Returns the finished assistant message, or None if the
+    # backend rejected the request.
+    st.markdown(user_message_html(message), unsafe_allow_html=True)
+    placeholder = st.empty()
+
+    reply, emotion = "", "neutral"
+    try:
+        for event in backend.chat_stream(message, st.session_state.user_id):
+            if event["type"] == "meta":
+                emotion = event["emotion"]
+            elif event["type"] == "delta":
+                reply += event["content"]
+                placeholder.markdown(assistant_message_html(reply + " ▌", emotion), unsafe_allow_html=True)
+            elif event["type"] == "done":
+                reply, emotion = event["reply"], event["emotion"]
+    except BackendUnavailable:
+        raise  # reported by the caller
+    except BackendError as e:
+        if e.status != 429:
+            return None
+        reply = "You're sending messages faster than I can keep up. Please wait a moment and try again."
+        emotion = "neutral"
+
+    placeholder.markdown(assistant_message_html(reply, emotion), unsafe_allow_html=True)
+    return {"role": "assistant", "content": reply, "emotion": emotion}
+
+
+def sync_history():
+    # The sidebar renders from st.session_state; the backend is only asked
+    # after something may have changed (login, a sent message), and then
+    # only for rows newer than the newest one cached. An unchanged history
+    # comes back as an empty 304.
+    if not st.session_state.history_stale:
+        return
+
+    items = st.session_state.history_items
+    page = backend.history(
+        st.session_state.user_id,
+        HISTORY_SIDEBAR_SIZE,
+        since_id=items[0]["id"] if items else None,
+        etag=st.session_state.history_etag
+    )
+    if not page.not_modified:
+        # has_more means there is a gap; the new rows alone are the latest
+        latest = page.items if page.has_more else page.items + items
+        st.session_state.history_items = latest[:HISTORY_SIDEBAR_SIZE]
+    st.session_state.history_etag = page.etag
+
+    st.session_state.history_stale = False
+
 
 # ==========================================
 # LOGIN / REGISTER PAGE
@@ -363,23 +467,20 @@ if not st.session_state.logged_in:
             if st.button("Sign In", key="login_btn", use_container_width=True):
                 if login_user and login_pass:
                     try:
-                        res = requests.post(
-                            f"{BASE_URL}/login",
-                            json={"username": login_user, "password": login_pass},
-                            timeout=10
-                        )
-                        if res.status_code == 200:
-                            data = res.json()
-                            st.session_state.logged_in = True
-                            st.session_state.user_id = data.get("user_id")
-                            st.session_state.username = login_user
-                            st.rerun()
+                        user_id = backend.login(login_user, login_pass)
+                    except BackendUnavailable:
+                        st.error("❌ Cannot connect to server. Is the backend running?")
+                    except BackendError as e:
+                        if e.status == 503:
+                            st.error("⏳ Server busy, try again in a moment")
                         else:
                             st.error("❌ Invalid username or password")
-                    except requests.exceptions.ConnectionError:
-                        st.error("❌ Cannot connect to server. Is the backend running?")
-                    except Exception as e:
-                        st.error(f"❌ Error: {str(e)}")
+                    else:
+                        st.session_state.logged_in = True
+                        st.session_state.user_id = user_id
+                        reset_history_cache()
+                        st.session_state.username = login_user
+                        st.rerun()
                 else:
                     st.warning("⚠️ Please enter both username and password")
         
@@ -399,21 +500,17 @@ if not st.session_state.logged_in:
                         st.error("❌ Password must be at least 4 characters")
                     else:
                         try:
-                            res = requests.post(
-                                f"{BASE_URL}/register",
-                                json={"username": reg_user, "password": reg_pass},
-                                timeout=10
-                            )
-                            if res.status_code == 201:
-                                st.success("✅ Account created successfully! Please sign in.")
-                            elif res.status_code == 400:
-                                st.error("❌ Username already exists")
+                            backend.register(reg_user, reg_pass)
+                            st.success("✅ Account created successfully! Please sign in.")
+                        except BackendUnavailable:
+                            st.error("❌ Cannot connect to server. Is the backend running?")
+                        except BackendError as e:
+                            if e.status == 400:
+                                st.error(f"❌ {e.message}")
+                            elif e.status == 503:
+                                st.error("⏳ Server busy, try again in a moment")
                             else:
                                 st.error("❌ Registration failed")
-                        except requests.exceptions.ConnectionError:
-                            st.error("❌ Cannot connect to server. Is the backend running?")
-                        except Exception as e:
-                            st.error(f"❌ Error: {str(e)}")
                 else:
                     st.warning("⚠️ Please fill in all fields")
     
@@ -481,23 +578,34 @@ else:
         # View History
         with st.expander("📜 Chat History"):
             try:
-                res = requests.post(
-                    f"{BASE_URL}/history",
-                    json={"user_id": st.session_state.user_id},
-                    timeout=10
-                )
-                if res.status_code == 200:
-                    history = res.json()
-                    if history:
-                        for item in history[-8:]:
-                            st.markdown(f"**You:** {item['message'][:50]}...")
-                            st.caption(f"Emotion: {item['emotion']}")
-                            st.markdown("---")
-                    else:
-                        st.caption("No history yet")
-            except:
+                sync_history()
+                history = st.session_state.history_items
+                if history:
+                    # Newest first from the backend; show oldest first
+                    for item in reversed(history):
+                        st.markdown(f"**You:** {item['message'][:50]}...")
+                        st.caption(f"Emotion: {item['emotion']}")
+                        st.markdown("---")
+                else:
+                    st.caption("No history yet")
+            except BackendError:
                 st.caption("Could not load history")
-        
+
+        # Client-side latency per backend endpoint (this process only)
+        with st.expander("⏱️ Connection"):
+            latency = backend.latency_stats()
+            if latency:
+                for endpoint, stats in sorted(latency.items()):
+                    if "p50_ms" in stats:
+                        st.caption(
+                            f"**{endpoint}**: p50 {stats['p50_ms']:.0f} ms, p95 {stats['p95_ms']:.0f} ms "
+                            f"({stats['count']} calls, {stats['errors']} errors)"
+                        )
+                    else:
+                        st.caption(f"**{endpoint}**: {stats['count']} calls, {stats['errors']} errors")
+            else:
+                st.caption("No requests yet")
+
         # Crisis resources
         st.markdown("""
         <div class="crisis-box">
@@ -518,6 +626,7 @@ else:
             st.session_state.user_id = None
             st.session_state.username = ""
             st.session_state.messages = []
+            reset_history_cache()
             st.rerun()
     
     # Main chat area
@@ -552,28 +661,9 @@ else:
     # Display messages
     for msg in st.session_state.messages:
         if msg["role"] == "user":
-            st.markdown(f"""
-            <div class="message-container user">
-                <div class="message-content">
-                    <div class="avatar user">👤</div>
-                    <div class="message-text">{msg["content"]}</div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(user_message_html(msg["content"]), unsafe_allow_html=True)
         else:
-            emotion = msg.get("emotion", "neutral").lower()
-            emotion_class = f"emotion-{emotion}" if emotion in ['joy', 'sadness', 'anger', 'fear', 'surprise', 'disgust'] else 'emotion-neutral'
-            st.markdown(f"""
-            <div class="message-container assistant">
-                <div class="message-content">
-                    <div class="avatar assistant">🧠</div>
-                    <div class="message-text">
-                        {msg["content"]}
-                        <br><span class="emotion-badge {emotion_class}">Detected: {emotion.capitalize()}</span>
-                    </div>
-                </div>
-            </div>
-            """, unsafe_allow_html=True)
+            st.markdown(assistant_message_html(msg["content"], msg.get("emotion", "neutral")), unsafe_allow_html=True)
     
     st.markdown('</div>', unsafe_allow_html=True)
     
@@ -585,21 +675,13 @@ else:
         # Add user message
         st.session_state.messages.append({"role": "user", "content": pending})
         
-        # Get AI response
+        # Stream AI response
         try:
-            res = requests.post(
-                f"{BASE_URL}/chat",
-                json={"message": pending, "user_id": st.session_state.user_id},
-                timeout=60
-            )
-            if res.status_code == 200:
-                data = res.json()
-                st.session_state.messages.append({
-                    "role": "assistant",
-                    "content": data["reply"],
-                    "emotion": data["emotion"]
-                })
-        except:
+            reply = stream_chat(pending)
+            if reply:
+                st.session_state.messages.append(reply)
+                st.session_state.history_stale = True
+        except BackendUnavailable:
             st.session_state.messages.append({
                 "role": "assistant",
                 "content": "I'm having trouble connecting right now. Please try again.",
@@ -612,32 +694,23 @@ else:
         # Add user message
         st.session_state.messages.append({"role": "user", "content": prompt})
         
-        # Get AI response
-        with st.spinner(""):
-            try:
-                res = requests.post(
-                    f"{BASE_URL}/chat",
-                    json={"message": prompt, "user_id": st.session_state.user_id},
-                    timeout=60
-                )
-                if res.status_code == 200:
-                    data = res.json()
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": data["reply"],
-                        "emotion": data["emotion"]
-                    })
-                else:
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": "Sorry, something went wrong. Please try again.",
-                        "emotion": "neutral"
-                    })
-            except Exception as e:
+        # Stream AI response
+        try:
+            reply = stream_chat(prompt)
+            if reply:
+                st.session_state.messages.append(reply)
+                st.session_state.history_stale = True
+            else:
                 st.session_state.messages.append({
                     "role": "assistant",
-                    "content": "I'm having trouble connecting to the server. Please ensure the backend is running.",
+                    "content": "Sorry, something went wrong. Please try again.",
                     "emotion": "neutral"
                 })
+        except BackendUnavailable:
+            st.session_state.messages.append({
+                "role": "assistant",
+                "content": "I'm having trouble connecting to the server. Please ensure the backend is running.",
+                "emotion": "neutral"
+            })
         
         st.rerun()